@@ -11,6 +11,7 @@ import threading
 import apsw
 import apsw.ext
 import globals
+import http_transport
 
 from base64 import b64encode
 from Crypto.PublicKey import RSA
@@ -27,7 +28,7 @@ apsw.ext.log_sqlite()
 
 # ===  Login to Anaplan - Basic Auth  ===
 # Login into Anaplan with basic authentication
-def basic_authentication(uri, username, password):
+def basic_authentication(uri, username, password, auth=globals.Auth):
     # Encode credentials
     encoded_credentials = str(b64encode((f'{username}:{password}'
                                                 ).encode('utf-8')).decode('utf-8'))
@@ -44,8 +45,8 @@ def basic_authentication(uri, username, password):
         res = anaplan_api(uri=uri, headers=headers)
 
         # Set values in AuthToken Dataclass
-        globals.Auth.access_token = res['tokenInfo']['tokenValue']
-        # globals.Auth.refresh_token = res['tokenInfo']['refreshTokenId']    # Not used
+        auth.access_token = res['tokenInfo']['tokenValue']
+        # auth.refresh_token = res['tokenInfo']['refreshTokenId']    # Not used
         logger.info("Access Token and Refresh Token received")
         print("Access Token and Refresh Token received")
 
@@ -57,7 +58,7 @@ def basic_authentication(uri, username, password):
 
 # ===  Login to Anaplan - Cert Auth  ===
 # Login into Anaplan with Certificate authentication
-def cert_authentication(uri, public_cert_path, private_key_path):
+def cert_authentication(uri, public_cert_path, private_key_path, auth=globals.Auth):
 
     try:
         # Split the privateKeyPath string using ':' as a delimiter
@@ -104,8 +105,8 @@ def cert_authentication(uri, public_cert_path, private_key_path):
         res = anaplan_api(uri=uri, headers=headers, body=body)
 
         # Set values in AuthToken Dataclass
-        globals.Auth.access_token = res['tokenInfo']['tokenValue']
-        # globals.Auth.refresh_token = res['tokenInfo']['refreshTokenId']    # Not used
+        auth.access_token = res['tokenInfo']['tokenValue']
+        # auth.refresh_token = res['tokenInfo']['refreshTokenId']    # Not used
         logger.info("Access Token and Refresh Token received")
         print("Access Token and Refresh Token received")
     
@@ -156,18 +157,24 @@ def extract_certificate_string(pem_file_path):
 
 # ===  Fetch new Access Token  ===
 # Response returns an updated `access_token` and `refresh_token`
-def refresh_tokens(uri, delay):
+# The token is stored on `auth`. Setting `stop_event` ends the refresh loop
+def refresh_tokens(uri, delay, auth=globals.Auth, stop_event=None):
+
+    # Without a stop event the loop runs until the main thread ends
+    if stop_event is None:
+        stop_event = threading.Event()
 
     # If delay is set then pause
     if delay > 0:
-        time.sleep(delay)
+        if stop_event.wait(delay):
+            return
 
     # As this is a daemon thread, keep looping until main thread ends
     while True:
 
         # Set headers
         headers = {
-            'Authorization': 'AnaplanAuthToken ' + globals.Auth.access_token,
+            'Authorization': 'AnaplanAuthToken ' + auth.access_token,
             'Content-Type': 'application/json',
             'Accept': 'application/json',
         }
@@ -178,14 +185,15 @@ def refresh_tokens(uri, delay):
             res = anaplan_api(uri=uri, headers=headers)
 
             # Set new Access Token
-            globals.Auth.access_token = res['tokenInfo']['tokenValue']
+            auth.access_token = res['tokenInfo']['tokenValue']
 
             logger.info("Updated Access Token received")
             print("Updated Access Token received")
 
             # If delay is set then continue to refresh the token
             if delay > 0:
-                time.sleep(delay)
+                if stop_event.wait(delay):
+                    break
             else:
                 break
 
@@ -200,20 +208,22 @@ def refresh_tokens(uri, delay):
 # Explicitly set the thread to be a subordinate daemon that will stop processing with main thread
 class refresh_token_thread (threading.Thread):
     # Overriding the default `__init__`
-   def __init__(self, thread_id, name, delay, uri):
+   def __init__(self, thread_id, name, delay, uri, auth=globals.Auth, stop_event=None):
       print('Refresh Token', thread_id, uri)
       threading.Thread.__init__(self)
       self.thread_id = thread_id
       self.name = name
       self.delay = delay
       self.uri = uri
+      self.auth = auth
+      self.stop_event = stop_event
       self.daemon = True
 
    # Overriding the default subfunction `run()`
    def run(self):
       # Initiate the thread
       print("Starting " + self.name)
-      refresh_tokens(self.uri, self.delay)
+      refresh_tokens(self.uri, self.delay, auth=self.auth, stop_event=self.stop_event)
       print("Exiting " + self.name)
 
 # === Interface with Anaplan REST API   ===
@@ -223,7 +233,7 @@ def anaplan_api(uri, headers={}, body={}):
 
     try:
         # POST to the Anaplan REST API to authentication tokens
-        res = requests.post(uri, headers=headers, json=body)
+        res = requests.post(uri, headers=headers, json=body, timeout=http_transport.get_timeout())
 
         # Check for unfavorable status codes
         res.raise_for_status()
@@ -6,7 +6,6 @@
 # ===============================================================================
 
 import sys
-import os
 import logging
 import requests
 import json
@@ -16,18 +15,31 @@ import apsw
 import apsw.ext
 import jwt
 import globals
+import http_transport
 
 
 # Enable logger
 logger = logging.getLogger(__name__)
 
+# Anaplan access tokens are valid for 35 minutes
+ACCESS_TOKEN_LIFETIME = 2100
+
+# Refresh a shared access token when it has less than this many seconds left
+REFRESH_MARGIN = 120
+
+# Seconds added to the request timeout when waiting for another process to finish its refresh
+LOCK_WAIT_MARGIN = 30
+
+# Attempts to take the token database write lock before giving up
+LOCK_ATTEMPTS = 3
+
 # ===  Step #1 - Device grant   ===
 # Upon success, returns a Device ID and Verification URL
-def get_device_id(uri):
+def get_device_id(uri, auth=globals.Auth):
 
     # Set Body
     get_body = {
-        "client_id": globals.Auth.client_id,
+        "client_id": auth.client_id,
         "scope": "openid profile email offline_access"
     }
 
@@ -37,7 +49,7 @@ def get_device_id(uri):
         res = anaplan_api(uri=uri, body=get_body)
 
         # Set values
-        globals.Auth.device_code = res['device_code']
+        auth.device_code = res['device_code']
         logger.info("Device Code successfully received")
         print("Device Code successfully received")
 
@@ -53,12 +65,12 @@ def get_device_id(uri):
 
 # ===  Step #2 - Device grant   ===
 # Response returns a `access_token` and `refresh_token`
-def get_tokens(uri, database):
+def get_tokens(uri, database, auth=globals.Auth):
 
     # Set Body
     get_body = {
-        "client_id": globals.Auth.client_id,
-        "device_code": globals.Auth.device_code,
+        "client_id": auth.client_id,
+        "device_code": auth.device_code,
         "grant_type": "urn:ietf:params:oauth:grant-type:device_code"
     }
 
@@ -68,13 +80,13 @@ def get_tokens(uri, database):
         res = anaplan_api(uri=uri, body=get_body)
 
         # Set values in AuthToken Dataclass
-        globals.Auth.access_token = res['access_token']
-        globals.Auth.refresh_token = res['refresh_token']
+        auth.access_token = res['access_token']
+        auth.refresh_token = res['refresh_token']
         logger.info("Access Token and Refresh Token received")
         print("Access Token and Refresh Token received")
 
         # Persist token values
-        write_token_db(database)
+        write_token_db(database, auth=auth, expires_at=time.time() + res.get('expires_in', ACCESS_TOKEN_LIFETIME))
 
     except Exception as err:
         print(f'{err} in function "{sys._getframe().f_code.co_name}"')
@@ -83,70 +95,116 @@ def get_tokens(uri, database):
 
 # ===  Step #3 - Device grant  ===
 # Response returns an updated `access_token` and `refresh_token`
-def refresh_tokens(uri, database, delay, rotatable_token):
+# The tokens are stored on `auth`. Setting `stop_event` ends the refresh loop
+# The token database is shared by every process on the host, so a fresh access token from another process is reused
+def refresh_tokens(uri, database, delay, rotatable_token, auth=globals.Auth, stop_event=None):
+
+    # Without a stop event the loop runs until the main thread ends
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    # As this is a daemon thread, keep looping until main thread ends
+    while True:
+        try:
+            expires_at = refresh_shared_tokens(uri=uri, database=database, rotatable_token=rotatable_token, auth=auth)
+
+            # If delay is set than continue to refresh the token
+            # Wake up early if the access token, possibly refreshed by another process, expires before the delay
+            if delay > 0:
+                if stop_event.wait(max(min(delay, expires_at - time.time() - REFRESH_MARGIN), 1)):
+                    break
+            else:
+                break
 
-    # If the refresh_token is not available then read from from the token database
-    if globals.Auth.refresh_token == "none":
-        tokens = read_token_db(database)
+        except Exception as err:
+            print(f'{err} in function "{sys._getframe().f_code.co_name}"')
+            logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
+            sys.exit(1)
+
+
+# ===  Refresh the tokens shared through the token database  ===
+# Returns the expiry time (epoch seconds) of the access token set on `auth`
+def refresh_shared_tokens(uri, database, rotatable_token, auth=globals.Auth):
+
+    connection = open_token_db(database)
 
-        if tokens['client_id'] == "empty":
+    try:
+        # Take the database write lock. Only one process refreshes at a time, the others wait and then reuse its access token.
+        # The lock is held across the refresh request, so the busy timeout covers the request timeout
+        for attempt in range(1, LOCK_ATTEMPTS + 1):
+            try:
+                connection.execute("begin immediate")
+                break
+            except apsw.BusyError:
+                if attempt == LOCK_ATTEMPTS:
+                    raise
+                logger.warning(f"Token database is locked by another process refreshing the tokens, waiting again (attempt {attempt} of {LOCK_ATTEMPTS})")
+
+        # Always use the latest refresh token, which another process may have rotated
+        row = connection.execute("select client_id, refresh_token from anaplan").fetchone()
+        if row is None:
             logger.warning("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 main.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
             print("This client needs to be authorized by Anaplan. Please run this script again with the following arguments: python3 main.py -r -c <<enter Client ID>>. For more information, use the argument `-h`.")
 
             # Exit with return code 1
             sys.exit(1)
 
-        globals.Auth.client_id = tokens['client_id']
-        globals.Auth.refresh_token = tokens['refresh_token']
+        auth.client_id = row[0]
+        auth.refresh_token = jwt.decode(row[1], auth.client_id, algorithms=["HS256"])['refresh_token']
+
+        # Reuse the cached access token while it is still valid
+        cached = connection.execute("select access_token, expires_at from access_token_cache where client_id=?", (auth.client_id,)).fetchone()
+        if cached and cached[1] - time.time() > REFRESH_MARGIN:
+            auth.access_token = jwt.decode(cached[0], auth.client_id, algorithms=["HS256"])['access_token']
+            connection.execute("commit")
+            logger.info("Reusing the shared Access Token")
+            print("Reusing the shared Access Token")
+            return cached[1]
 
-    # As this is a daemon thread, keep looping until main thread ends
-    while True:
         get_body = {
-            "client_id": globals.Auth.client_id,
-            "refresh_token": globals.Auth.refresh_token,
+            "client_id": auth.client_id,
+            "refresh_token": auth.refresh_token,
             "grant_type": "refresh_token"
         }
-        try:
-            logger.info("Requesting new Token(s)")
-            print("Requesting new Token(s)")
-            res = anaplan_api(uri=uri, body=get_body)
+
+        logger.info("Requesting new Token(s)")
+        print("Requesting new Token(s)")
+        res = anaplan_api(uri=uri, body=get_body)
+
+        # Set new Access Token
+        auth.access_token = res['access_token']
+        expires_at = time.time() + res.get('expires_in', ACCESS_TOKEN_LIFETIME)
+
+        # Set values in AuthToken Dataclass
+        if rotatable_token:
+
+            # If the response does not contain a refresh_token key then handle the exception
+            try:
+                auth.refresh_token = res['refresh_token']
+            except KeyError:
+                logger.info("Check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings")
+                print("Check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings")
+                sys.exit(1)
 
             logger.info("Updated Access Token and Refresh Token received")
             print("Updated Access Token and Refresh Token received")
+        else:
+            logger.info("Updated Access Token received")
+            print("Updated Access Token received")
 
-            # Set new Access Token
-            globals.Auth.access_token = res['access_token']
-
-            # Set values in AuthToken Dataclass
-            if rotatable_token:
-
-                # If the response does not contain a refresh_token key then handle the exception
-                try:
-                    globals.Auth.refresh_token = res['refresh_token']
-                except KeyError:
-                    logger.info("Check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings")
-                    print("Check that `rotatableToken` is set properly in the `settings.json` file and corresponds to the Anaplan OAuth Client settings")
-                    sys.exit(1)
-                
-                logger.info("Updated Access Token and Refresh Token received")
-                print("Updated Access Token and Refresh Token received")
-
-                # Persist token values
-                write_token_db(database=database)
-            else:
-                logger.info("Updated Access Token received")
-                print("Updated Access Token received")
+        # Persist token values before releasing the lock
+        save_tokens(connection, auth, expires_at)
+        connection.execute("commit")
+        return expires_at
 
-            # If delay is set than continue to refresh the token
-            if delay > 0:
-                time.sleep(delay)
-            else:
-                break
+    except BaseException:
+        # Release the lock for the other processes on any failure, including `sys.exit`
+        if not connection.getautocommit():
+            connection.execute("rollback")
+        raise
 
-        except Exception as err:
-            print(f'{err} in function "{sys._getframe().f_code.co_name}"')
-            logging.error(f'{err} in function "{sys._getframe().f_code.co_name}"')
-            sys.exit(1)
+    finally:
+        connection.close()
 
 
 # ===  Refresh token class  ===
@@ -154,7 +212,7 @@ def refresh_tokens(uri, database, delay, rotatable_token):
 # Explicitly set the thread to be a subordinate daemon that will stop processing with main thread
 class refresh_token_thread (threading.Thread):
     # Overriding the default `__init__`
-   def __init__(self, thread_id, name, delay, database, uri, rotatable_token):
+   def __init__(self, thread_id, name, delay, database, uri, rotatable_token, auth=globals.Auth, stop_event=None):
       print('Refresh Token', thread_id, uri)
       threading.Thread.__init__(self)
       self.thread_id = thread_id
@@ -163,13 +221,15 @@ class refresh_token_thread (threading.Thread):
       self.database = database
       self.uri = uri
       self.rotatable_token = rotatable_token
+      self.auth = auth
+      self.stop_event = stop_event
       self.daemon = True
 
    # Overriding the default subfunction `run()`
    def run(self):
       # Initiate the thread
       print("Starting " + self.name)
-      refresh_tokens(uri=self.uri, delay=self.delay, database=self.database, rotatable_token=self.rotatable_token)
+      refresh_tokens(uri=self.uri, delay=self.delay, database=self.database, rotatable_token=self.rotatable_token, auth=self.auth, stop_event=self.stop_event)
       print("Exiting " + self.name)
 
 
@@ -186,7 +246,7 @@ def anaplan_api(uri, body={}):
 
     try:
         # POST to the Anaplan REST API to receive OAuth values
-        res = requests.post(uri, headers=get_headers, json=body)
+        res = requests.post(uri, headers=get_headers, json=body, timeout=http_transport.get_timeout())
 
         # Check for unfavorable status codes
         res.raise_for_status()
@@ -211,56 +271,57 @@ def anaplan_api(uri, body={}):
 
 
 
-# === Read a SQLite database ===
-def read_token_db(database):
+# === Open the shared token database ===
+# WAL mode lets processes read while another one refreshes, the busy timeout makes them wait for the write lock
+# for as long as a refresh request of the process holding it may take
+def open_token_db(database):
 
-    # Initialize variable
-    tokens = {}
+    connect_timeout, read_timeout = http_transport.get_timeout()
+    connection = apsw.Connection(database)
+    connection.setbusytimeout(int((connect_timeout + read_timeout + LOCK_WAIT_MARGIN) * 1000))
+    connection.execute("pragma journal_mode=wal")
 
-    # Check if SQLite database exists
-    if os.path.isfile(database):
-        # Create connection to the existing database
-        connection = apsw.Connection(
-            database, flags=apsw.SQLITE_OPEN_READONLY)
+    # Create the tables to store the encrypted tokens
+    connection.execute("create table if not exists anaplan (client_id, refresh_token)")
+    connection.execute("create table if not exists access_token_cache (client_id primary key, access_token, expires_at)")
 
-        # Get values
-        for client_id, refresh_token in connection.execute("select client_id, refresh_token from anaplan"):
-            tokens = {"client_id": client_id, "refresh_token": jwt.decode(
-                refresh_token, client_id, algorithms=["HS256"])['refresh_token']}
+    return connection
 
-    else:
-        logger.warning("Database file does not exist")
-        tokens = {"client_id": "empty", "refresh_token": "empty"}
-
-    return tokens
 
-
-# === Create or update a SQLite database ===
-def write_token_db(database):
+# === Save the tokens on an open connection ===
+def save_tokens(connection, auth=globals.Auth, expires_at=None):
 
     # Encode
     encoded_token = jwt.encode(
-        payload={"refresh_token": globals.Auth.refresh_token}, 
-        key=globals.Auth.client_id, 
+        payload={"refresh_token": auth.refresh_token}, 
+        key=auth.client_id, 
         algorithm="HS256")
-    values = (globals.Auth.client_id, encoded_token)
-
-    # Check if SQLite database exists
-    if os.path.isfile(database):
-        # Create connection to the existing database
-        connection = apsw.Connection(
-            database, flags=apsw.SQLITE_OPEN_READWRITE)
-        
+    values = (auth.client_id, encoded_token)
+
+    if connection.execute("select count(*) from anaplan").fetchone()[0]:
         # Pass to the SQL update statement the `client_id` and `refresh_token` stored in the values
         connection.execute("update anaplan set client_id=$client_id, refresh_token=$refresh_token", values)
     else:
-        # Create a new database
-        connection = apsw.Connection(database)
-
-        # Create the database to store the encrypted tokens. 
-        connection.execute("create table if not exists anaplan (client_id, refresh_token)")
-
         # Pass to the SQL insert statement the `client_id` and `refresh_token` stored in the values
         connection.execute("insert into anaplan values($client_id, $refresh_token)", values)
 
+    # Share the access token with the other processes until it expires
+    if expires_at is not None:
+        encoded_access_token = jwt.encode(
+            payload={"access_token": auth.access_token},
+            key=auth.client_id,
+            algorithm="HS256")
+        connection.execute("insert or replace into access_token_cache values(?, ?, ?)", (auth.client_id, encoded_access_token, expires_at))
+
     logger.info("Tokens updated")
+
+
+# === Create or update a SQLite database ===
+def write_token_db(database, auth=globals.Auth, expires_at=None):
+
+    # Create or open the database. It may already exist without the token tables (e.g. after a calibration run)
+    connection = open_token_db(database)
+    try:
+        save_tokens(connection, auth, expires_at)
+    finally:
+        connection.close()
@@ -7,21 +7,62 @@
 
 
 import logging
+import threading
 import requests
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, FIRST_EXCEPTION
 import sys
 import os
 import time
 import json
 import globals
+import http_transport
+import progress
+import chunk_store
 
 
 # Enable logger
 logger = logging.getLogger(__name__)
 
 
+# === Errors ===
+class AnaplanApiError(Exception):
+    """
+    Raised by `anaplan_api` with `raise_errors=True` when a request fails after all retries.
+    """
+
+    def __init__(self, message, uri=None, status_code=None):
+        super().__init__(message)
+        self.uri = uri
+        self.status_code = status_code
+
+
+class ChunkUploadError(AnaplanApiError):
+    """
+    Raised by `upload_chunk` when a chunk cannot be uploaded.
+    """
+
+    def __init__(self, message, chunk_num, uri=None, status_code=None):
+        super().__init__(message, uri=uri, status_code=status_code)
+        self.chunk_num = chunk_num
+
+
+class UploadFailedError(Exception):
+    """
+    Raised by `upload_all_chunks` when at least one chunk failed. Lists the chunk numbers that succeeded, failed and
+    were skipped after the upload was cancelled.
+    """
+
+    def __init__(self, file_id, succeeded, failed, skipped):
+        super().__init__(f'Upload to file ID {file_id} failed: {len(succeeded)} chunks succeeded, '
+                         f'{len(failed)} failed {sorted(failed)}, {len(skipped)} skipped')
+        self.file_id = file_id
+        self.succeeded = succeeded
+        self.failed = failed    # chunk number -> error
+        self.skipped = skipped
+
+
 # === Interface with Anaplan REST API   ===
-def anaplan_api(uri, verb, data=None, body={}, token_type="Bearer ", compress_upload_chunks=True, verbose_endpoint_logging=False, retry_count=3):
+def anaplan_api(uri, verb, data=None, body={}, token_type="Bearer ", compress_upload_chunks=True, verbose_endpoint_logging=False, retry_count=3, progress=None, auth=None, client=None, raise_errors=False, accept=None):
     """
     Sends a request to the Anaplan API using the specified URI, HTTP verb, and request data.
 
@@ -31,6 +72,12 @@ def anaplan_api(uri, verb, data=None, body={}, token_type="Bearer ", compress_up
         data (bytes, optional): The data to send in the request body for 'PUT' requests. Defaults to None.
         body (dict, optional): The JSON data to send in the request body for 'POST' requests. Defaults to {}.
         token_type (str, optional): The type of authentication token to include in the request header. Defaults to "Bearer ".
+        progress (progress.ProgressReporter, optional): When set, retries are counted on the progress line instead of printed.
+        auth (globals.Auth, optional): The token state to use. Defaults to the shared `globals.Auth`.
+        client (http_transport.Http1Client or Http2Client, optional): The HTTP client to use. Defaults to the shared transport.
+        raise_errors (bool, optional): Raise `AnaplanApiError` instead of exiting when the request fails after all retries.
+            Worker threads use this so the caller can cancel the remaining work.
+        accept (str, optional): Overrides the `Accept` header, e.g. `application/octet-stream` to download file chunks.
 
     Returns:
         requests.Response: The response object returned by the API.
@@ -46,35 +93,43 @@ def anaplan_api(uri, verb, data=None, body={}, token_type="Bearer ", compress_up
         logger.info(f'Verb: {verb}   URI: {uri}')
         print(f'Verb: {verb}   URI: {uri}')
 
+    # Use the shared token state unless the caller owns its own (e.g. `upload_client.UploadClient`)
+    if auth is None:
+        auth = globals.Auth
+
     # Set the header based upon the REST API verb 
     # Use 'application/x-gzip' for PUT requests to upload a compressed file or 'application/octet-stream' for an uncompressed file
     if verb == 'PUT':    
         get_headers = {
             'Content-Type': 'application/x-gzip' if compress_upload_chunks else 'application/octet-stream',
             'Accept': '*/*',
-            'Authorization': token_type + globals.Auth.access_token
+            'Authorization': token_type + auth.access_token
         }
     else: 
         get_headers = {
             'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Authorization': token_type + globals.Auth.access_token
+            'Accept': accept or 'application/json',
+            'Authorization': token_type + auth.access_token
         }
 
+    # Use the shared pooled transport (HTTP/1.1 or HTTP/2 depending on `httpTransport`) unless a client is passed in
+    if client is None:
+        client = http_transport.get_client()
+
     # Select operation based upon the the verb
     for attempt in range(retry_count + 1):
         try:
             match verb:
                 case 'GET':
-                    res = requests.get(uri, headers=get_headers)
+                    res = client.request('GET', uri, headers=get_headers)
                 case 'POST':
-                    res = requests.post(uri, headers=get_headers, json=body)
+                    res = client.request('POST', uri, headers=get_headers, json=body)
                 case 'PUT':
-                    res = requests.put(uri, headers=get_headers, data=data)
+                    res = client.request('PUT', uri, headers=get_headers, data=data)
                 case 'DELETE':
-                    res = requests.delete(uri, headers=get_headers)
+                    res = client.request('DELETE', uri, headers=get_headers)
                 case 'PATCH':
-                    res = requests.patch(uri, headers=get_headers)
+                    res = client.request('PATCH', uri, headers=get_headers)
             
             res.raise_for_status()
 
@@ -84,28 +139,40 @@ def anaplan_api(uri, verb, data=None, body={}, token_type="Bearer ", compress_up
         except requests.exceptions.HTTPError as err:
             # Handle HTTPError specifically
             if attempt < retry_count:
-                print(f'Retry {attempt + 1}/{retry_count} after HTTP error: {err}')
+                if progress:
+                    progress.retry()
+                else:
+                    print(f'Retry {attempt + 1}/{retry_count} after HTTP error: {err}')
                 logger.info(f'Retry {attempt + 1}/{retry_count} after HTTP error: {err}')
                 time.sleep(2)  # Exponential backoff
             else:
                 print(f'HTTP error in function "{sys._getframe().f_code.co_name}" after {retry_count} retries: {err}')
                 logger.error(f'HTTP error in function "{sys._getframe().f_code.co_name}" after {retry_count} retries: {err}')
+                if raise_errors:
+                    raise AnaplanApiError(str(err), uri=uri, status_code=err.response.status_code if err.response is not None else None) from err
                 sys.exit(1)  # Kills the existing thread and raises the last HTTPError after all retries have failed
 
         except requests.exceptions.RequestException as err:
             # Handle other request exceptions
             if attempt < retry_count:
-                print(f'Retry {attempt + 1}/{retry_count} after Non-HTTP request error: {err}')
+                if progress:
+                    progress.retry()
+                else:
+                    print(f'Retry {attempt + 1}/{retry_count} after Non-HTTP request error: {err}')
                 logger.info(f'Retry {attempt + 1}/{retry_count} after Non-HTTP request error: {err}')
                 time.sleep(2)  # Exponential backoff
             else:
                 print(f'Non-HTTP request error in function "{sys._getframe().f_code.co_name}" after {retry_count} retries: {err}')
                 logger.error(f'HTTP request error in function "{sys._getframe().f_code.co_name}" after {retry_count} retries: {err}')
+                if raise_errors:
+                    raise AnaplanApiError(str(err), uri=uri) from err
                 sys.exit(1)  # Kills the existing thread and raises the last Non-HTTPError after all retries have failed
 
         except Exception as err:
             print(f'Unexpected error in function "{sys._getframe().f_code.co_name}": {err}')
             logger.error(f'Unexpected error in function "{sys._getframe().f_code.co_name}": {err}')
+            if raise_errors:
+                raise AnaplanApiError(str(err), uri=uri) from err
             sys.exit(1)  # Kills the existing thread and raises an exception after all retries have failed
 
 
@@ -129,12 +196,7 @@ def fetch_file_id(**kwargs):
 
     """
     try:
-        # If import_data_source is provided then set as file name
-        if kwargs.get("import_data_source"):
-            file_name = kwargs["import_data_source"]
-        else:
-            # Isolate file name
-            file_name = os.path.basename(kwargs["file_to_upload"])
+        file_name = get_data_source_name(**kwargs)
             
         logger.info(f"File name to search for: {file_name}")
         print(f"File name to search for: {file_name}")
@@ -159,6 +221,18 @@ def fetch_file_id(**kwargs):
         raise
 
 
+# === Get the name of the import data source ===
+def get_data_source_name(**kwargs):
+    """
+    Returns `import_data_source` if provided, otherwise the file name of `file_to_upload`.
+    """
+    # If import_data_source is provided then set as file name
+    if kwargs.get("import_data_source"):
+        return kwargs["import_data_source"]
+    # Isolate file name
+    return os.path.basename(kwargs["file_to_upload"])
+
+
 # === Get File ID ===
 def get_file_id(file_name, **kwargs):
     """
@@ -173,7 +247,7 @@ def get_file_id(file_name, **kwargs):
     """
     # Get a list of files
     uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files'
-    res = anaplan_api(uri=uri, verb="GET", verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"])
+    res = anaplan_api(uri=uri, verb="GET", verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
 
     # Isolate the nested_results
     files = json.loads(res.text)['files']
@@ -199,10 +273,28 @@ def create_import_data_source(file_name, **kwargs):
         str: The ID of the created file.
     """
     uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files/{file_name}'
-    res = anaplan_api(uri, verb="POST", body={"chunkCount": 0}, verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"])
+    res = anaplan_api(uri, verb="POST", body={"chunkCount": 0}, verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
     return json.loads(res.text)['file']['id']
 
 
+# === Delete File in Anaplan ===
+def delete_file(file_id, **kwargs):
+    """
+    Deletes a file (import data source) from Anaplan.
+
+    Args:
+        file_id (str): The ID of the file in Anaplan.
+        **kwargs: Additional keyword arguments containing the base URI, workspace ID, and model ID.
+
+    Returns:
+        None
+    """
+    uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files/{file_id}'
+    anaplan_api(uri=uri, verb="DELETE", verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
+    logger.info(f'File ID {file_id} deleted.')
+    print(f'File ID {file_id} deleted.')
+
+
 # === Set Chunk Count ===
 def set_chunk_count(chunk_count, file_id, **kwargs):
     """
@@ -218,40 +310,223 @@ def set_chunk_count(chunk_count, file_id, **kwargs):
     """
     # Set count
     uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files/{file_id}'
-    anaplan_api(uri=uri, verb="POST", body={'chunkCount': chunk_count}, verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"])
+    anaplan_api(uri=uri, verb="POST", body={'chunkCount': chunk_count}, verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
     logger.info(f'Chunk count set to {chunk_count} for file ID {file_id}.')
     print(f'Chunk count set to {chunk_count} for file ID {file_id}.')
 
 
+# === Complete File ===
+def complete_file(file_id, chunk_count, **kwargs):
+    """
+    Marks a file whose chunk count was set to -1 (unknown) as complete once all of its chunks have been uploaded.
+
+    Parameters:
+    - file_id (str): The ID of the file in Anaplan.
+    - chunk_count (int): The number of chunks uploaded.
+    - **kwargs: Additional keyword arguments containing the base URI, workspace ID, and model ID.
+
+    Returns:
+    None
+    """
+    uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files/{file_id}/complete'
+    body = {'id': file_id, 'name': get_data_source_name(**kwargs), 'chunkCount': chunk_count}
+    anaplan_api(uri=uri, verb="POST", body=body, verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
+    logger.info(f'File ID {file_id} completed with {chunk_count} chunks.')
+    print(f'File ID {file_id} completed with {chunk_count} chunks.')
+
+
+# === Run Import or Process ===
+def run_action(action_type, action_id, poll_interval=5, **kwargs):
+    """
+    Runs an import, export or process in Anaplan and waits for the task to complete.
+
+    Args:
+        action_type (str): Either `imports`, `exports` or `processes`.
+        action_id (str): The ID of the import, export or process.
+        poll_interval (int): Seconds between task status checks.
+        **kwargs: Additional keyword arguments containing the base URI, workspace ID, and model ID.
+
+    Returns:
+        dict: The task as returned by the API when it is complete.
+
+    Raises:
+        RuntimeError: If the task completes without success.
+    """
+    uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/{action_type}/{action_id}/tasks'
+    res = anaplan_api(uri=uri, verb="POST", body={"localeName": "en_US"}, verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
+    task_id = json.loads(res.text)['task']['taskId']
+    logger.info(f'Started task {task_id} of {action_type} {action_id}.')
+    print(f'Started task {task_id} of {action_type} {action_id}.')
+
+    # Poll the task until it is complete
+    while True:
+        time.sleep(poll_interval)
+        res = anaplan_api(uri=f'{uri}/{task_id}', verb="GET", verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
+        task = json.loads(res.text)['task']
+        if task['taskState'] == 'COMPLETE':
+            break
+
+    if not task.get('result', {}).get('successful', False):
+        logger.error(f'Task {task_id} of {action_type} {action_id} failed: {task.get("result")}')
+        raise RuntimeError(f'Task {task_id} of {action_type} {action_id} failed')
+
+    logger.info(f'Task {task_id} of {action_type} {action_id} completed successfully.')
+    print(f'Task {task_id} of {action_type} {action_id} completed successfully.')
+    return task
+
+
 # === Upload Chunk === 
 def upload_chunk(file_path, file_id, chunk_num, **kwargs):
     """
     Uploads a single chunk to an API.
 
     Parameters:
-    file_path (str): The path of the file to be uploaded.
+    file_path (str or chunk_store.MemoryChunk): The path of the file to be uploaded, or a chunk kept in memory.
     file_id (str): The ID of the file.
     chunk_num (int): The number of the chunk being uploaded.
     **kwargs: Additional keyword arguments containing the base URI, workspace ID, and model ID.
+        An optional `cancel_event` (threading.Event) skips the chunk once the upload has been cancelled.
+        An optional `done_event` (threading.Event) skips a hedged attempt once every chunk has been uploaded.
 
     Returns:
-    None
+    bool: True if the chunk was uploaded, False if it was skipped.
+
+    Raises:
+    ChunkUploadError: If the chunk cannot be uploaded after all retries.
     """
+    # Do not start new chunks once another chunk has failed, or late hedged attempts once the upload is done
+    if any(kwargs.get(event) is not None and kwargs[event].is_set() for event in ("cancel_event", "done_event")):
+        return False
 
-    # Read in file and PUT to endpoint 
-    with open(file_path, 'rb') as file:
+    # Read in file content, from disk or from the chunk store's memory
+    file_content = chunk_store.read_chunk(file_path)
+    if file_content is None:
+        # The memory chunk was released after the other attempt of a hedged chunk won
+        return False
 
-        # Read in file content
-        file_content = file.read()
+    # Console output is aggregated by the progress reporter, the log write is queued
+    logger.info(f'Uploading chunk {chunk_num} of file ID {file_id}.')
 
-        logger.info(f'Uploading chunk {chunk_num} of file ID {file_id}.')
-        print(f'Uploading chunk {chunk_num} of file ID {file_id}.')
+    # Set URI
+    uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files/{file_id}/chunks/{chunk_num}'
 
-        # Set URI
-        uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files/{file_id}/chunks/{chunk_num}'
-        
-        # PUT to endpoint
-        anaplan_api(uri=uri, verb="PUT", data=file_content, compress_upload_chunks=kwargs["compress_upload_chunks"], verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"])
+    # PUT to endpoint
+    try:
+        anaplan_api(uri=uri, verb="PUT", data=file_content, compress_upload_chunks=kwargs["compress_upload_chunks"], verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"), progress=kwargs.get("progress"), raise_errors=True)
+    except AnaplanApiError as err:
+        raise ChunkUploadError(f'Chunk {chunk_num} of file ID {file_id} failed: {err}', chunk_num, uri=err.uri, status_code=err.status_code) from err
+
+    # Update the aggregated progress line, unless this was a losing hedged attempt
+    if kwargs.get("progress") and not (kwargs.get("done_event") is not None and kwargs["done_event"].is_set()):
+        kwargs["progress"].advance(len(file_content), chunk_num=chunk_num)
+    return True
+
+
+# === Cancel the chunks that have not started ===
+def cancel_upload(futures, cancel_event):
+    """
+    Stops an upload after an unrecoverable chunk error. Queued futures are cancelled and chunks that are about to
+    start are skipped through `cancel_event`. Chunks already being sent are allowed to finish.
+    """
+    cancel_event.set()
+    cancelled = sum(future.cancel() for future in list(futures))
+    logger.warning(f'Upload cancelled, {cancelled} queued chunks will not be sent')
+    print(f'\nUpload cancelled, {cancelled} queued chunks will not be sent')
+
+
+# === Wait for chunk uploads, hedging stragglers ===
+def wait_with_hedging(pool, upload_task, file_id, hedge_settings, results, **kwargs):
+    """
+    Uploads all chunks and waits for them. Once every chunk has started (the queue has drained), a duplicate PUT is
+    issued for any chunk that has been running longer than the configured percentile of the completed uploads, and
+    whichever attempt finishes first wins. This is safe because chunk PUTs are idempotent by chunk number.
+
+    Once every chunk is done, the attempts still queued are cancelled and those about to start are skipped, so no
+    late duplicate reads a chunk after the caller has deleted or released it.
+
+    Parameters:
+    - pool (concurrent.futures.Executor): The pool running the uploads.
+    - upload_task (callable): The function uploading a chunk, usually `upload_chunk`.
+    - file_id (str): The ID of the file.
+    - hedge_settings (dict): The `hedgeUploads` block from `settings.json` (`percentile`, `minSamples`, `maxHedges`).
+    - results (dict): Filled with the `succeeded` chunk numbers and the `failed` chunk numbers and their errors.
+    - kwargs (dict): Keyword arguments passed to `upload_task`, including the `cancel_event` of the upload.
+
+    Returns:
+    - int: The number of duplicate PUTs issued.
+    """
+    lock = threading.Lock()
+    kwargs["done_event"] = threading.Event()
+    started = {}     # chunk ID -> monotonic start time of the first attempt
+    latencies = []   # durations of the successful attempts
+
+    def timed_upload(file_path, chunk_id):
+        start_time = time.monotonic()
+        with lock:
+            started.setdefault(chunk_id, start_time)
+        uploaded = upload_task(file_path, file_id, chunk_id, **kwargs)
+        with lock:
+            latencies.append(time.monotonic() - start_time)
+        return uploaded
+
+    chunk_files = kwargs["chunk_files"]
+    attempts = {}    # future -> chunk ID
+    for chunk_id, file_path in enumerate(chunk_files):
+        attempts[pool.submit(timed_upload, file_path, chunk_id)] = chunk_id
+    remaining = set(range(len(chunk_files)))
+    hedged = set()
+    errors = {}      # chunk ID -> error of its last failed attempt
+    cancel_event = kwargs["cancel_event"]
+
+    try:
+        while remaining:
+            done, _ = wait(attempts, timeout=0.5, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                chunk_id = attempts.pop(future)
+                if chunk_id not in remaining:
+                    continue  # The other attempt already won
+                if not future.cancelled() and future.exception() is None and future.result():
+                    remaining.discard(chunk_id)
+                    results["succeeded"].add(chunk_id)
+                    continue
+                if not future.cancelled() and future.exception() is not None:
+                    errors[chunk_id] = future.exception()
+                if chunk_id not in attempts.values():
+                    # No attempt left for this chunk, it either failed or was skipped after a cancellation
+                    remaining.discard(chunk_id)
+                    if chunk_id in errors:
+                        results["failed"][chunk_id] = errors[chunk_id]
+                        if not cancel_event.is_set():
+                            cancel_upload(attempts, cancel_event)
+
+            # Never hedge a cancelled upload
+            if cancel_event.is_set():
+                continue
+
+            # Only hedge once the queue has drained, so duplicates never delay chunks that have not started yet
+            with lock:
+                queue_drained = all(chunk_id in started for chunk_id in remaining)
+                samples = sorted(latencies)
+            if not queue_drained or len(samples) < hedge_settings["minSamples"] or len(hedged) >= hedge_settings["maxHedges"]:
+                continue
+
+            threshold = samples[min(len(samples) - 1, int(len(samples) * hedge_settings["percentile"] / 100))]
+            now = time.monotonic()
+            for chunk_id in sorted(remaining - hedged):
+                if now - started[chunk_id] > threshold and len(hedged) < hedge_settings["maxHedges"]:
+                    logger.info(f'Hedging chunk {chunk_id}: running {now - started[chunk_id]:.1f}s, p{hedge_settings["percentile"]} is {threshold:.1f}s')
+                    attempts[pool.submit(timed_upload, chunk_files[chunk_id], chunk_id)] = chunk_id
+                    hedged.add(chunk_id)
+    finally:
+        # The losing attempts of hedged chunks must not run once the caller cleans up the chunks
+        kwargs["done_event"].set()
+        for future in attempts:
+            future.cancel()
+
+    if hedged:
+        logger.info(f'Issued {len(hedged)} hedged chunk uploads: {sorted(hedged)}')
+    return len(hedged)
 
 
 #def upload_all_chunks(directory_path, max_workers=5, **kwargs):
@@ -261,15 +536,22 @@ def upload_all_chunks(**kwargs):
 
     Parameters:
     - kwargs (dict): Keyword arguments containing the necessary information for uploading chunks.
-        - chunk_files (list): List of file paths for each chunk.
+        - chunk_files (list): List of file paths for each chunk, or chunks kept in memory by a chunk store.
         - max_workers (int): Maximum number of worker threads to use.
+        - profiler (profiler.PhaseProfiler, optional): Records per-thread timings when profiling is enabled.
+        - executor (concurrent.futures.Executor, optional): Reuse an existing pool instead of creating one per upload.
+        - hedge_settings (dict, optional): The `hedgeUploads` block from `settings.json`. See `wait_with_hedging`.
+        - auth, client (optional): Token state and HTTP client passed on to `anaplan_api`.
         - Other optional arguments specific to the upload process.
 
+    The first chunk that fails after all retries cancels the upload: chunks that have not started are skipped and only
+    the chunks already being sent are waited for.
+
     Returns:
-    - None
+    - str: The ID of the file in Anaplan.
 
     Raises:
-    - Any exceptions that occur during the upload process.
+    - UploadFailedError: If any chunk failed, with the chunks that succeeded, failed and were skipped.
 
     """
     # Get File ID
@@ -279,14 +561,168 @@ def upload_all_chunks(**kwargs):
     chunk_count = len(kwargs["chunk_files"])
     set_chunk_count(chunk_count, file_id, **kwargs)
 
-    with ThreadPoolExecutor(max_workers=kwargs["max_workers"]) as executor:
-     
-        # Use enumerate to get the index (chunk_id) and file_path for each file
-        futures = [executor.submit(upload_chunk, file_path, file_id, chunk_id, **kwargs) 
-                for chunk_id, file_path in enumerate(kwargs["chunk_files"])]
-        
-        # Wait for all futures to complete and potentially collect results
-        for future in futures:
-            result = future.result()  # This blocks until the future is completed
+    # Report progress on a single rate-limited line instead of a print per chunk
+    total_bytes = sum(chunk_store.chunk_size(file_path) for file_path in kwargs["chunk_files"])
+    kwargs["progress"] = progress.ProgressReporter(total_chunks=chunk_count, total_bytes=total_bytes)
+
+    # When profiling, record the wall and CPU time of every upload per worker thread
+    profiler = kwargs.get("profiler")
+    upload_task = profiler.wrap_worker("upload", upload_chunk) if profiler else upload_chunk
+
+    # Reuse the caller's pool if one is passed in, otherwise create one for this upload
+    executor = kwargs.get("executor")
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ThreadPoolExecutor(max_workers=kwargs["max_workers"], thread_name_prefix="upload")
+
+    # Set on the first unrecoverable error so the remaining chunks are skipped
+    kwargs["cancel_event"] = threading.Event()
+    results = {"succeeded": set(), "failed": {}}
+
+    hedge_count = 0
+    try:
+        if kwargs.get("hedge_settings") and kwargs["hedge_settings"]["enabled"]:
+            # Issue duplicate PUTs for straggler chunks once the queue has drained
+            hedge_count = wait_with_hedging(executor, upload_task, file_id, results=results, **kwargs)
+        else:
+            # Use enumerate to get the index (chunk_id) and file_path for each file
+            futures = {executor.submit(upload_task, file_path, file_id, chunk_id, **kwargs): chunk_id
+                       for chunk_id, file_path in enumerate(kwargs["chunk_files"])}
+
+            # Wait for the futures, cancelling the rest of the upload on the first error
+            collect_chunk_results(futures, set(futures), results, kwargs["cancel_event"])
+    finally:
+        if owns_executor:
+            # Do not wait for losing hedged attempts that are still running, and drop those still queued
+            executor.shutdown(wait=hedge_count == 0, cancel_futures=True)
+
+    kwargs["progress"].finish()
+
+    if results["failed"]:
+        skipped = set(range(chunk_count)) - results["succeeded"] - set(results["failed"])
+        report_failed_upload(file_id, chunk_count, results["succeeded"], results["failed"], skipped)
+        raise UploadFailedError(file_id, results["succeeded"], results["failed"], skipped)
+
+    return file_id
+
+
+# === Collect the results of chunk uploads ===
+def collect_chunk_results(futures, pending, results, cancel_event, block=True):
+    """
+    Records the finished chunk futures in `results` and cancels the rest of the upload on the first failure.
+
+    Parameters:
+    - futures (dict): Future -> chunk number.
+    - pending (set): The futures not collected yet.
+    - results (dict): Filled with the `succeeded` chunk numbers and the `failed` chunk numbers and their errors.
+    - cancel_event (threading.Event): Set on the first failure.
+    - block (bool): Wait until every pending future is done. Otherwise only collect the futures already done.
+
+    Returns:
+    - set: The futures still pending.
+    """
+    while pending:
+        done, pending = wait(pending, timeout=None if block else 0, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                results["failed"][futures[future]] = future.exception()
+            elif future.result():
+                results["succeeded"].add(futures[future])
+        if results["failed"] and not cancel_event.is_set():
+            cancel_upload(pending, cancel_event)
+        if not block:
+            break
+    return pending
+
+
+# === Upload chunks while they are being written ===
+def upload_chunk_stream(chunk_stream, **kwargs):
+    """
+    Uploads chunks as they are produced, e.g. by `file_ops.iter_chunked_files` running on a background thread, so
+    the first PUT goes out as soon as the first chunk is written. The chunk count is set to -1 (unknown) up front
+    and the file is completed with the final count once every chunk has been uploaded.
+
+    Straggler hedging needs the full list of chunks and is not used here.
+
+    Parameters:
+    - chunk_stream (iterable): Yields the chunk file paths, or chunks kept in memory, in chunk order.
+    - kwargs (dict): The keyword arguments of `upload_all_chunks`, without `chunk_files`.
+        - file_id (str, optional): The file ID if it has already been resolved.
+
+    Returns:
+    - list: The paths of the uploaded chunk files.
+
+    Raises:
+    - UploadFailedError: If any chunk failed, with the chunks that succeeded, failed and were skipped.
+    """
+    # Get File ID unless it was resolved while the first chunks were written, and mark the chunk count as unknown
+    file_id = kwargs.pop("file_id", None) or fetch_file_id(**kwargs)
+    set_chunk_count(-1, file_id, **kwargs)
+
+    # The totals of the progress line grow as chunks are written
+    kwargs["progress"] = progress.ProgressReporter(total_chunks=0, total_bytes=0)
+    kwargs["cancel_event"] = threading.Event()
+
+    profiler = kwargs.get("profiler")
+    upload_task = profiler.wrap_worker("upload", upload_chunk) if profiler else upload_chunk
+
+    executor = kwargs.get("executor")
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ThreadPoolExecutor(max_workers=kwargs["max_workers"], thread_name_prefix="upload")
+
+    chunk_files = []
+    futures = {}     # future -> chunk ID
+    pending = set()
+    results = {"succeeded": set(), "failed": {}}
+    try:
+        for chunk_id, file_path in enumerate(chunk_stream):
+            chunk_files.append(file_path)
+            kwargs["progress"].add_total(chunk_store.chunk_size(file_path))
+            future = executor.submit(upload_task, file_path, file_id, chunk_id, **kwargs)
+            futures[future] = chunk_id
+            pending.add(future)
+
+            # Stop reading chunks once a chunk has failed
+            pending = collect_chunk_results(futures, pending, results, kwargs["cancel_event"], block=False)
+            if kwargs["cancel_event"].is_set():
+                break
+
+        collect_chunk_results(futures, pending, results, kwargs["cancel_event"])
+    except BaseException:
+        # The chunker failed, do not send the chunks still queued
+        cancel_upload(pending, kwargs["cancel_event"])
+        raise
+    finally:
+        if owns_executor:
+            executor.shutdown()
+
+    kwargs["progress"].finish()
+
+    if results["failed"]:
+        skipped = set(range(len(chunk_files))) - results["succeeded"] - set(results["failed"])
+        report_failed_upload(file_id, len(chunk_files), results["succeeded"], results["failed"], skipped)
+        raise UploadFailedError(file_id, results["succeeded"], results["failed"], skipped)
+
+    complete_file(file_id, len(chunk_files), **kwargs)
+    return chunk_files
+
+
+# === Report a failed upload ===
+def report_failed_upload(file_id, chunk_count, succeeded, failed, skipped):
+    """
+    Prints which chunks of a failed upload succeeded, failed (with their errors) and were skipped.
+    """
+    logger.error(f'Upload to file ID {file_id} failed. Chunks succeeded: {len(succeeded)}/{chunk_count}, '
+                 f'failed: {sorted(failed)}, skipped: {len(skipped)}')
+    print(f'Upload to file ID {file_id} failed. Chunks succeeded: {len(succeeded)}/{chunk_count}, '
+          f'failed: {len(failed)}, skipped: {len(skipped)}')
+    for chunk_num, error in sorted(failed.items()):
+        logger.error(f'Chunk {chunk_num} failed: {error}')
+        print(f'  Chunk {chunk_num} failed: {error}')
+    if skipped:
+        logger.info(f'Skipped chunks: {sorted(skipped)}')
         
 
@@ -0,0 +1,175 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Benchmark of the chunkers in `file_ops` with baseline comparison for regression tracking
+# ===============================================================================
+
+import os
+import sys
+import json
+import time
+import random
+import contextlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+# Allow the project modules to be imported when running from the `benchmarks` folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import file_ops
+import parallel_gzip
+
+
+# === Generate a synthetic CSV ===
+def write_synthetic_csv(path, size_mb, line_length, seed=42):
+    """
+    Writes a CSV of about `size_mb` megabytes whose lines average `line_length` bytes. The content is reproducible
+    for a given seed so runs can be compared.
+    """
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    text_length = max(line_length - 30, 1)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 10))) for _ in range(500)]
+
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write('id,account,period,amount,description\n')
+        written = 0
+        row = 0
+        while written < target:
+            description = ''
+            while len(description) < rng.randint(text_length // 2, text_length * 3 // 2):
+                description += rng.choice(words) + ' '
+            line = f'{row},A{rng.randint(1, 9999):04d},2026-{rng.randint(1, 12):02d},{rng.uniform(-1e6, 1e6):.2f},{description.strip()}\n'
+            file.write(line)
+            written += len(line)
+            row += 1
+
+
+# === Chunkers ===
+def chunk_by_lines(file, chunk_size_mb, compress):
+    return file_ops.write_chunked_files(file=file, chunk_size_mb=chunk_size_mb, compress_upload_chunks=compress)
+
+
+def chunk_by_byte_ranges(file, chunk_size_mb, compress):
+    directory, base, ext = file_ops.split_source_name(file)
+    return [file_ops.write_chunk_range(file, start, end, file_ops.build_chunk_path(directory, base, ext, number, compress), compress)
+            for number, (start, end) in enumerate(file_ops.compute_chunk_boundaries(file, chunk_size_mb), start=1)]
+
+
+def chunk_by_line_index(file, chunk_size_mb, compress):
+    return file_ops.write_chunked_files(file=file, chunk_size_mb=chunk_size_mb, compress_upload_chunks=compress, use_line_index=True)
+
+
+CHUNKERS = {
+    "lines": chunk_by_lines,
+    "byte-ranges": chunk_by_byte_ranges,
+    "line-index": chunk_by_line_index,
+}
+
+
+# === Measure a chunker ===
+def measure(chunker, file, chunk_size_mb, compress, repeat):
+    """
+    Returns the best throughput of `repeat` runs in MB/s and the peak Python heap of a separate traced run in MB.
+    Timing and tracing are separate runs because `tracemalloc` slows down allocation-heavy code.
+    """
+    size_mb = os.path.getsize(file) / (1024 * 1024)
+    best = None
+
+    # The chunkers print a line per chunk, which is not part of the measurement
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            chunk_files = chunker(file, chunk_size_mb, compress)
+            elapsed = time.perf_counter() - start_time
+            for chunk_file in chunk_files:
+                os.remove(chunk_file)
+            best = elapsed if best is None else min(best, elapsed)
+
+        tracemalloc.start()
+        chunk_files = chunker(file, chunk_size_mb, compress)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for chunk_file in chunk_files:
+            os.remove(chunk_file)
+
+    return {"mb_s": size_mb / best, "peak_mb": peak / (1024 * 1024)}
+
+
+# === Compare with a baseline ===
+def compare(results, baseline, threshold):
+    """
+    Returns the cases that are more than `threshold` percent slower than the baseline, or use more than `threshold`
+    percent more memory. Cases missing from either side are ignored.
+    """
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        before = baseline[case]
+        if result["mb_s"] < before["mb_s"] * (1 - threshold / 100):
+            regressions.append(f'{case}: {result["mb_s"]:.1f} MB/s, baseline {before["mb_s"]:.1f} MB/s')
+        # Ignore small absolute differences in memory, which are mostly noise
+        if result["peak_mb"] > before["peak_mb"] * (1 + threshold / 100) and result["peak_mb"] - before["peak_mb"] > 1:
+            regressions.append(f'{case}: peak {result["peak_mb"]:.1f} MB, baseline {before["peak_mb"]:.1f} MB')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput and peak memory of the chunkers in `file_ops`")
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[8, 32], help="Sizes of the synthetic files")
+    parser.add_argument('--line-lengths', type=int, nargs='+', default=[60, 600], help="Average line lengths in bytes")
+    parser.add_argument('--chunk-size-mb', type=int, default=4, help="Chunk size")
+    parser.add_argument('--chunkers', nargs='+', choices=list(CHUNKERS), default=list(CHUNKERS), help="Chunkers to measure")
+    parser.add_argument('--gzip-threads', type=int, default=1, help="Threads compressing each chunk, 1 compresses on the chunking thread")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case, the best one is kept")
+    parser.add_argument('--save', help="Write the results to this JSON file, e.g. to create a baseline")
+    parser.add_argument('--baseline', help="Compare the results with this JSON file")
+    parser.add_argument('--threshold', type=float, default=10, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    parallel_gzip.configure({"enabled": args.gzip_threads > 1, "threads": args.gzip_threads})
+
+    results = {}
+    print(f'{"Case":<40}{"MB/s":>10}{"Peak MB":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        for size_mb in args.sizes_mb:
+            for line_length in args.line_lengths:
+                file = os.path.join(directory, f'synthetic_{size_mb}mb_{line_length}b.csv')
+                write_synthetic_csv(file, size_mb, line_length)
+
+                # Build the line index once, the benchmark measures re-chunking with an existing index
+                if "line-index" in args.chunkers:
+                    file_ops.load_line_index(file)
+
+                for chunker in args.chunkers:
+                    for compress in (False, True):
+                        compression = ("gzip" if args.gzip_threads == 1 else f'gzip{args.gzip_threads}') if compress else "plain"
+                        case = f'{chunker}/{compression}/{size_mb}mb/{line_length}b'
+                        results[case] = measure(CHUNKERS[chunker], file, args.chunk_size_mb, compress, args.repeat)
+                        print(f'{case:<40}{results[case]["mb_s"]:>10.1f}{results[case]["peak_mb"]:>10.1f}')
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump({"python": platform.python_version(), "machine": platform.platform(),
+                       "created": time.strftime("%Y-%m-%d %H:%M:%S"), "chunkSizeMb": args.chunk_size_mb,
+                       "results": results}, file, indent=4)
+        print(f'Results written to {args.save}')
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regressions of more than {args.threshold:g}% against {args.baseline}:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print(f'\nNo regressions of more than {args.threshold:g}% against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
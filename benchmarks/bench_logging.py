@@ -0,0 +1,100 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Benchmark of the per-chunk logging and console overhead with many upload threads
+# ===============================================================================
+
+import os
+import sys
+import time
+import queue
+import logging
+import logging.handlers
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Allow the project modules to be imported when running from the `benchmarks` folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from progress import ProgressReporter
+
+
+FORMAT = '%(asctime)s  :  %(levelname)s  :  %(message)s'
+
+
+# === Synchronous print and file handler (previous behaviour) ===
+def run_synchronous(log_file, console, chunks, threads):
+    logger = logging.getLogger("bench.synchronous")
+    handler = logging.FileHandler(log_file)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    def upload_chunk(chunk_num):
+        logger.info(f'Uploading chunk {chunk_num} of file ID benchmark.')
+        print(f'Uploading chunk {chunk_num} of file ID benchmark.', file=console, flush=True)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(upload_chunk, range(chunks)))
+    elapsed = time.perf_counter() - start_time
+
+    logger.removeHandler(handler)
+    handler.close()
+    return elapsed
+
+
+# === Queued logging and aggregated progress line ===
+def run_queued(log_file, console, chunks, threads):
+    logger = logging.getLogger("bench.queued")
+    log_queue = queue.SimpleQueue()
+    handler = logging.FileHandler(log_file)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+
+    progress = ProgressReporter(total_chunks=chunks, total_bytes=chunks, stream=console)
+
+    def upload_chunk(chunk_num):
+        logger.info(f'Uploading chunk {chunk_num} of file ID benchmark.')
+        progress.advance(1)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(upload_chunk, range(chunks)))
+    progress.finish()
+    elapsed = time.perf_counter() - start_time
+
+    # Writing the backlog is the listener's job and is not on the upload threads' path
+    listener.stop()
+    logger.removeHandler(queue_handler)
+    handler.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the logging and console overhead per uploaded chunk")
+    parser.add_argument('--chunks', type=int, default=20000, help="Number of simulated chunk uploads")
+    parser.add_argument('--threads', type=int, default=200, help="Upload threads")
+    parser.add_argument('--stdout', action='store_true', help="Write console output to the terminal instead of discarding it")
+    args = parser.parse_args()
+
+    console = sys.stdout if args.stdout else open(os.devnull, 'w')
+    with tempfile.TemporaryDirectory() as directory:
+        synchronous = run_synchronous(os.path.join(directory, 'synchronous.log'), console, args.chunks, args.threads)
+        queued = run_queued(os.path.join(directory, 'queued.log'), console, args.chunks, args.threads)
+
+    print(f'{"Mode":<14}{"Seconds":>10}{"us/chunk":>12}')
+    print(f'{"synchronous":<14}{synchronous:>10.3f}{1e6 * synchronous / args.chunks:>12.1f}')
+    print(f'{"queued":<14}{queued:>10.3f}{1e6 * queued / args.chunks:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
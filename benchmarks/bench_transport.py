@@ -0,0 +1,117 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Benchmark of the `requests` HTTP/1.1 and `httpx` HTTP/2 transports against a local stand-in server
+# ===============================================================================
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# Allow the project modules to be imported when running from the `benchmarks` folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import http_transport
+
+
+# === Stand-in server ===
+# Minimal ASGI app mimicking the chunk upload endpoint. Every response reports the number of distinct client connections seen.
+def run_stand_in_server(host, port):
+    import asyncio
+    from hypercorn.config import Config
+    from hypercorn.asyncio import serve
+
+    connections = set()
+
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        connections.add(tuple(scope['client']))
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get('more_body', False)
+        await send({'type': 'http.response.start', 'status': 204,
+                    'headers': [(b'x-connections', str(len(connections)).encode())]})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    config = Config()
+    config.bind = [f'{host}:{port}']
+    config.loglevel = 'WARNING'
+    asyncio.run(serve(app, config))
+
+
+# === Upload chunks concurrently ===
+def run_transport(client, uri, chunk_count, chunk_size_kb, thread_count):
+    """
+    PUTs `chunk_count` chunks concurrently and returns the elapsed time and the connections used.
+    """
+    payload = os.urandom(chunk_size_kb * 1024)
+    headers = {'Content-Type': 'application/octet-stream', 'Accept': '*/*'}
+
+    def put_chunk(chunk_num):
+        res = client.request('PUT', f'{uri}/chunks/{chunk_num}', headers=headers, data=payload)
+        res.raise_for_status()
+        return int(res.headers['x-connections'])
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        connections = max(executor.map(put_chunk, range(chunk_count)))
+    return time.perf_counter() - start_time, connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the HTTP/1.1 and HTTP/2 upload transports")
+    parser.add_argument('--chunks', type=int, default=200, help="Number of chunks to PUT")
+    parser.add_argument('--chunk_size_kb', type=int, default=256, help="Size of each chunk in KB")
+    parser.add_argument('--threads', type=int, default=50, help="Upload threads")
+    parser.add_argument('--http2_connections', type=int, default=4, help="Maximum HTTP/2 connections")
+    parser.add_argument('--port', type=int, default=8443, help="Port of the local stand-in server")
+    parser.add_argument('--min_upload_kb_per_second', type=int, default=16,
+                        help="Minimum upload rate of the stall watchdog, as `minUploadKbPerSecond` in `settings.json`. 0 turns it off")
+    args = parser.parse_args()
+
+    try:
+        import hypercorn
+        import httpx
+        import h2
+    except ImportError:
+        print("The transport benchmark requires the `hypercorn` and `httpx[http2]` libraries. Please run `pip install hypercorn httpx[http2]`")
+        sys.exit(1)
+
+    # Upload through the stall watchdog like a run with the shipped settings
+    timeouts = {**http_transport.DEFAULT_TIMEOUTS, "minUploadKbPerSecond": args.min_upload_kb_per_second}
+
+    # Each transport gets a fresh server so the connection counts are independent
+    results = {}
+    for transport in ("requests", "http2"):
+        server = multiprocessing.Process(target=run_stand_in_server, args=('127.0.0.1', args.port), daemon=True)
+        server.start()
+        time.sleep(1)  # Give the server time to bind
+
+        try:
+            if transport == "http2":
+                client = http_transport.create_client(transport="http2", max_connections=args.http2_connections,
+                                                      prior_knowledge=True, timeouts=timeouts)
+            else:
+                client = http_transport.create_client(transport="requests", max_connections=args.threads, timeouts=timeouts)
+
+            uri = f'http://127.0.0.1:{args.port}/files/benchmark'
+            results[transport] = run_transport(client, uri, args.chunks, args.chunk_size_kb, args.threads)
+            client.close()
+        finally:
+            server.terminate()
+            server.join()
+
+    total_mb = args.chunks * args.chunk_size_kb / 1024
+    print(f'{"Transport":<10}{"Seconds":>10}{"MB/s":>10}{"Connections":>14}')
+    for transport, (elapsed, connections) in results.items():
+        print(f'{transport:<10}{elapsed:>10.2f}{total_mb / elapsed:>10.1f}{connections:>14}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Benchmark of the pre-flight validation against the chunking time of the same file
+# ===============================================================================
+
+import os
+import sys
+import time
+import contextlib
+import argparse
+import tempfile
+
+# Allow the project modules to be imported when running from the `benchmarks` folder
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import file_ops
+import validation
+from bench_file_ops import write_synthetic_csv
+
+
+# === Time a run, keeping the best of `repeat` ===
+def best_time(function, repeat, cleanup=None):
+    best = None
+    # The chunker and the validation print progress, which is not part of the measurement
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start_time
+            best = elapsed if best is None else min(best, elapsed)
+            if cleanup:
+                cleanup(result)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pre-flight validation time with the chunking time")
+    parser.add_argument('--size_mb', type=int, default=256, help="Size of the synthetic CSV in MB")
+    parser.add_argument('--line_length', type=int, default=120, help="Average line length in bytes")
+    parser.add_argument('--chunk_size_mb', type=int, default=50, help="Chunk size in MB")
+    parser.add_argument('--range_size_mb', type=int, default=16, help="Size of the ranges validated by each task")
+    parser.add_argument('--processes', type=int, default=0, help="Validation processes. 0 uses one per CPU")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case, the best one is reported")
+    args = parser.parse_args()
+
+    validation_settings = {"delimiter": ",", "quoteChar": '"', "expectedHeader": [], "maxErrors": 100,
+                           "processes": args.processes, "rangeSizeMb": args.range_size_mb}
+
+    with tempfile.TemporaryDirectory() as directory:
+        file = os.path.join(directory, 'synthetic.csv')
+        write_synthetic_csv(file, args.size_mb, args.line_length)
+
+        results = {
+            "validation": best_time(lambda: validation.validate_file(file, validation_settings), args.repeat),
+            "chunking": best_time(lambda: file_ops.write_chunked_files(file=file, chunk_size_mb=args.chunk_size_mb, compress_upload_chunks=False),
+                                  args.repeat, cleanup=file_ops.delete_files),
+            "chunking (gzip)": best_time(lambda: file_ops.write_chunked_files(file=file, chunk_size_mb=args.chunk_size_mb, compress_upload_chunks=True),
+                                         args.repeat, cleanup=file_ops.delete_files),
+        }
+
+    # The validation time as a share of each stage, it should be a small fraction of the chunking time
+    print(f'{"Stage":<18}{"Seconds":>10}{"MB/s":>10}{"Validation %":>15}')
+    for stage, elapsed in results.items():
+        print(f'{stage:<18}{elapsed:>10.2f}{args.size_mb / elapsed:>10.1f}{100 * results["validation"] / elapsed:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module to calibrate the upload settings per model and persist the best configuration
+# ===============================================================================
+
+import os
+import sys
+import time
+import socket
+import logging
+import itertools
+import tempfile
+import apsw
+import anaplan_ops
+import file_ops
+import http_transport
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Write a line-aligned sample of the source file ===
+def write_sample_file(file, sample_size_mb, directory):
+    """
+    Copies whole lines from the start of a file until the sample size is reached.
+
+    Returns:
+        tuple: The path of the sample file and its size in bytes.
+    """
+    max_size = sample_size_mb * 1024 * 1024
+    _, file_base_name, file_extension = file_ops.split_source_name(file)
+    sample_file = os.path.join(directory, f"{file_base_name}{file_extension}")
+    sample_size = 0
+
+    # Compressed sources are sampled from their uncompressed content
+    with file_ops.open_source(file, 'rb') as source, open(sample_file, 'wb') as sample:
+        for line in source:
+            if sample_size + len(line) > max_size and sample_size > 0:
+                break
+            sample.write(line)
+            sample_size += len(line)
+
+    return sample_file, sample_size
+
+
+# === Run the calibration ===
+def calibrate(file, database, calibration_settings, transport="requests", http2_max_connections=4, timeouts=None, **kwargs):
+    """
+    Uploads a sample of the file to a scratch import data source with every combination of thread count, chunk
+    size and compression, and stores the configuration with the highest throughput for the workspace, model and host.
+
+    Each configuration uploads through its own HTTP client, sized like a run with that thread count would size the
+    shared transport. A pool smaller than the thread count would discard and re-open connections on every request.
+    The scratch import data source is removed from the model even if an upload fails.
+
+    Args:
+        file (str): The path of the file to sample.
+        database (str): The SQLite database used to persist the tuned settings.
+        calibration_settings (dict): The `calibration` block from `settings.json`.
+        transport (str): The `httpTransport` setting, `requests` or `http2`.
+        http2_max_connections (int): The `http2MaxConnections` setting, the pool size of the `http2` transport.
+        timeouts (dict, optional): The `timeouts` block from `settings.json`.
+        **kwargs: Keyword arguments passed to `anaplan_ops.upload_all_chunks` (base URI, workspace ID, model ID, ...).
+
+    Returns:
+        dict: The best configuration.
+    """
+    results = []
+    scratch_data_source = f'calibration_{os.path.basename(file)}'
+    grid = list(itertools.product(calibration_settings["threadCounts"], calibration_settings["chunkSizesMb"], calibration_settings["compression"]))
+
+    # An empty `threadCounts`, `chunkSizesMb` or `compression` list leaves nothing to compare. A failed trial raises
+    # `anaplan_ops.UploadFailedError`, so every configuration of a non-empty grid is measured
+    if not grid:
+        logger.error("Calibration not started, the `calibration` grid is empty")
+        print("Please update the `calibration` settings in the `settings.json` file with at least one value in `threadCounts`, `chunkSizesMb` and `compression`")
+        sys.exit(1)
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            sample_file, sample_size = write_sample_file(file, calibration_settings["sampleSizeMb"], directory)
+            logger.info(f'Calibrating {len(grid)} configurations with a {sample_size / (1024 * 1024):.1f} MB sample')
+            print(f'Calibrating {len(grid)} configurations with a {sample_size / (1024 * 1024):.1f} MB sample')
+
+            for thread_count, chunk_size_mb, compress_upload_chunks in grid:
+                # HTTP/1.1 needs a connection per thread, HTTP/2 multiplexes the uploads over a few connections
+                client = http_transport.create_client(transport=transport, timeouts=timeouts,
+                                                      max_connections=http2_max_connections if transport == "http2" else thread_count)
+                try:
+                    # Chunking and compression are part of the measurement as they trade CPU for bandwidth
+                    start_time = time.perf_counter()
+                    chunk_files = file_ops.write_chunked_files(file=sample_file, chunk_size_mb=chunk_size_mb, compress_upload_chunks=compress_upload_chunks)
+                    anaplan_ops.upload_all_chunks(**{**kwargs,
+                                                     "file_to_upload": sample_file,
+                                                     "import_data_source": scratch_data_source,
+                                                     "chunk_files": chunk_files,
+                                                     "compress_upload_chunks": compress_upload_chunks,
+                                                     "max_workers": thread_count,
+                                                     "client": client})
+                    elapsed = time.perf_counter() - start_time
+                finally:
+                    client.close()
+                file_ops.delete_files(chunk_files)
+
+                throughput = sample_size / (1024 * 1024) / elapsed
+                results.append({"thread_count": thread_count, "chunk_size_mb": chunk_size_mb,
+                                "compress_upload_chunks": compress_upload_chunks, "throughput_mb_s": throughput})
+                logger.info(f'Threads: {thread_count}, chunk size: {chunk_size_mb} MB, compression: {compress_upload_chunks} -> {throughput:.2f} MB/s')
+                print(f'Threads: {thread_count}, chunk size: {chunk_size_mb} MB, compression: {compress_upload_chunks} -> {throughput:.2f} MB/s')
+
+    finally:
+        # Remove the scratch import data source from the model, also after a failed upload
+        file_id = anaplan_ops.get_file_id(scratch_data_source, **kwargs)
+        if file_id:
+            anaplan_ops.delete_file(file_id, **kwargs)
+
+    best = max(results, key=lambda result: result["throughput_mb_s"])
+    write_tuned_settings(database, kwargs["workspace_id"], kwargs["model_id"], best)
+    logger.info(f'Best configuration stored: {best}')
+    print(f'Best configuration: {best["thread_count"]} threads, {best["chunk_size_mb"]} MB chunks, compression {best["compress_upload_chunks"]} at {best["throughput_mb_s"]:.2f} MB/s')
+
+    return best
+
+
+# === Persist the tuned settings ===
+def write_tuned_settings(database, workspace_id, model_id, best):
+    connection = apsw.Connection(database)
+    connection.execute("""create table if not exists tuned_settings (
+                            workspace_id, model_id, host, thread_count, chunk_size_mb, compress_upload_chunks,
+                            throughput_mb_s, calibrated_at, primary key (workspace_id, model_id, host))""")
+    connection.execute("insert or replace into tuned_settings values(?, ?, ?, ?, ?, ?, ?, ?)",
+                       (workspace_id, model_id, socket.gethostname(), best["thread_count"], best["chunk_size_mb"],
+                        int(best["compress_upload_chunks"]), best["throughput_mb_s"], time.strftime("%Y-%m-%d %H:%M:%S")))
+    connection.close()
+
+
+# === Read the tuned settings ===
+def read_tuned_settings(database, workspace_id, model_id):
+    """
+    Reads the tuned settings stored for the workspace, model and this host.
+
+    Returns:
+        dict or None: The tuned settings, or None if the model has not been calibrated on this host.
+    """
+    if not os.path.isfile(database):
+        return None
+
+    connection = apsw.Connection(database, flags=apsw.SQLITE_OPEN_READONLY)
+    try:
+        rows = list(connection.execute(
+            "select thread_count, chunk_size_mb, compress_upload_chunks, throughput_mb_s, calibrated_at from tuned_settings where workspace_id=? and model_id=? and host=?",
+            (workspace_id, model_id, socket.gethostname())))
+    except apsw.SQLError:
+        # The table is created on the first calibration
+        return None
+    finally:
+        connection.close()
+
+    if not rows:
+        return None
+
+    thread_count, chunk_size_mb, compress_upload_chunks, throughput_mb_s, calibrated_at = rows[0]
+    return {"thread_count": thread_count, "chunk_size_mb": chunk_size_mb, "compress_upload_chunks": bool(compress_upload_chunks),
+            "throughput_mb_s": throughput_mb_s, "calibrated_at": calibrated_at}
@@ -0,0 +1,254 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module to keep the chunks of a file across runs so a repeat upload does not chunk it again
+# ===============================================================================
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+import contextlib
+import chunk_store
+import file_ops
+import parallel_gzip
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = 'manifest.lock'
+
+# Chunks are written into a folder with this prefix and linked into the entry once complete
+TEMP_PREFIX = '.tmp-'
+
+# Folders of chunks that were never completed are removed once they are this old
+ORPHAN_AGE_SECONDS = 24 * 60 * 60
+
+
+# === Chunk cache ===
+class ChunkCache:
+    """
+    Keeps the chunks of a source file in `directory`, keyed by the fingerprint of the file (see
+    `file_ops.file_fingerprint`) and the settings that change the chunks: chunk size, compression, compression
+    level, gzip passthrough and line index. A run with the same file and settings reuses the chunks instead of
+    chunking and compressing the file again, e.g. after a failed upload or to upload the file to another model.
+
+    Each entry is a folder of chunks listed in `manifest.json` with its size and last use. Several runs can share
+    the cache: the manifest is only read and written under a lock file. New chunks are written into a temporary
+    folder of the run and hard-linked into the entry folder once all of them are written, so an entry folder is
+    never partial and the run keeps uploading from its own copies.
+
+    When the entries exceed `quota_bytes`, the least recently used entries are removed. Entries used within the last
+    `lease_seconds` may still be uploaded from and are kept, as is the newest entry, even over the quota.
+
+    Cached chunks are handed out as `chunk_store.CachedChunk` paths, which `file_ops.delete_files` keeps.
+    """
+
+    def __init__(self, directory, quota_bytes, lease_seconds=3600):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # === Key of a file and chunk settings ===
+    def build_key(self, file, chunk_size_mb, compress_upload_chunks, passthrough_compressed_source, use_line_index):
+        settings = {"fingerprint": file_ops.file_fingerprint(file), "chunkSizeMb": chunk_size_mb,
+                    "compressUploadChunks": compress_upload_chunks, "compressionLevel": parallel_gzip.compression_level(),
+                    "passthroughCompressedSource": passthrough_compressed_source, "useLineIndex": use_line_index}
+        return hashlib.blake2b(json.dumps(settings, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+    # === Lock the manifest against other threads and processes ===
+    @contextlib.contextmanager
+    def manifest_lock(self):
+        with self.lock, open(os.path.join(self.directory, LOCK_FILE), 'a+b') as lock_file:
+            if os.name == "nt":
+                lock_file.seek(0)
+                while True:
+                    try:
+                        # Retries for 10 seconds before raising
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    # === Manifest ===
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST_FILE), 'r', encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            logger.warning(f'Unable to read the chunk cache manifest, starting an empty cache: {err}')
+            return {}
+
+    def write_manifest(self, manifest):
+        # Replace the manifest in one step so a crash never leaves a partial manifest
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+        os.replace(f'{path}.tmp', path)
+
+    # === Look up the chunks of an entry ===
+    def lookup(self, key):
+        """
+        Returns the chunk paths of an entry and marks it as used, or None if there is no complete entry.
+        """
+        with self.manifest_lock():
+            manifest = self.read_manifest()
+            entry = manifest.get(key)
+            if entry is None:
+                return None
+
+            chunk_files = [os.path.join(self.directory, key, chunk_name) for chunk_name in entry["chunks"]]
+            if not all(os.path.isfile(chunk_file) for chunk_file in chunk_files):
+                logger.warning(f'Chunk cache entry {key} is missing chunks and is removed')
+                del manifest[key]
+                self.write_manifest(manifest)
+                shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+                return None
+
+            # The last use also protects the entry from eviction while it is uploaded
+            entry["lastUsed"] = time.time()
+            self.write_manifest(manifest)
+        return [chunk_store.CachedChunk(chunk_file) for chunk_file in chunk_files]
+
+    # === Add a complete entry ===
+    def commit(self, key, source, chunk_files):
+        """
+        Links the chunk files written by a run into the folder of the entry and adds the entry. If another run added
+        the same entry in the meantime, its chunks are kept and only the last use is updated.
+        """
+        with self.manifest_lock():
+            manifest = self.read_manifest()
+            if key in manifest:
+                manifest[key]["lastUsed"] = time.time()
+            else:
+                # A folder without an entry was left by a run that stopped while linking
+                entry_directory = os.path.join(self.directory, key)
+                shutil.rmtree(entry_directory, ignore_errors=True)
+                os.makedirs(entry_directory)
+                for chunk_file in chunk_files:
+                    os.link(chunk_file, os.path.join(entry_directory, os.path.basename(chunk_file)))
+                manifest[key] = {"source": os.path.abspath(source), "chunks": [os.path.basename(chunk_file) for chunk_file in chunk_files],
+                                 "bytes": sum(os.path.getsize(chunk_file) for chunk_file in chunk_files), "lastUsed": time.time()}
+            self.evict(manifest, keep=key)
+            self.write_manifest(manifest)
+
+    # === Remove the least recently used entries ===
+    def evict(self, manifest, keep):
+        now = time.time()
+        total_bytes = sum(entry["bytes"] for entry in manifest.values())
+        for key in sorted(manifest, key=lambda key: manifest[key]["lastUsed"]):
+            if total_bytes <= self.quota_bytes:
+                break
+            # Entries used recently may still be uploaded by another step or run
+            if key == keep or now - manifest[key]["lastUsed"] < self.lease_seconds:
+                continue
+            total_bytes -= manifest[key]["bytes"]
+            del manifest[key]
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            logger.info(f'Evicted chunk cache entry {key}')
+
+        if total_bytes > self.quota_bytes:
+            logger.info(f'Chunk cache holds {total_bytes} bytes over its quota, the remaining entries are in use')
+
+        # Remove the folders of runs that stopped while chunking and the chunks left after uploads
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name not in manifest and os.path.isdir(path) and now - os.path.getmtime(path) > ORPHAN_AGE_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+
+    # === Reuse or write the chunks of a file ===
+    def iter_chunked_files(self, file, chunk_size_mb, compress_upload_chunks, passthrough_compressed_source=False, use_line_index=False):
+        """
+        Yields the cached chunks of a file, or chunks the file with `file_ops.iter_chunked_files` into a temporary
+        folder of this run and adds the chunks to the cache once the last chunk is written.
+
+        New chunks are yielded as plain paths in the temporary folder, so the caller deletes them after the upload
+        like any other chunk, while the cache keeps its own links to them.
+        """
+        try:
+            key = self.build_key(file, chunk_size_mb, compress_upload_chunks, passthrough_compressed_source, use_line_index)
+        except FileNotFoundError:
+            logger.error(f"File not found: {file}")
+            print(f"Error: The file {file} does not exist.")
+            sys.exit(1)
+
+        chunk_files = self.lookup(key)
+        if chunk_files is not None:
+            logger.info(f'Reusing {len(chunk_files)} cached chunks of {file} from {os.path.join(self.directory, key)}')
+            print(f'Reusing {len(chunk_files)} cached chunks of {file}')
+            yield from chunk_files
+            return
+
+        # Each run writes into its own folder, so concurrent runs of the same file do not overwrite each other
+        temp_directory = os.path.join(self.directory, f'{TEMP_PREFIX}{uuid.uuid4().hex}')
+        chunk_files = []
+        for chunk_file in file_ops.iter_chunked_files(file, chunk_size_mb, compress_upload_chunks, passthrough_compressed_source,
+                                                      use_line_index, store=chunk_store.DiskChunkStore(temp_directory)):
+            if chunk_file == file:
+                # A passed-through source is not copied into the cache
+                shutil.rmtree(temp_directory, ignore_errors=True)
+                yield chunk_file
+                return
+            chunk_files.append(chunk_file)
+            yield chunk_file
+
+        self.commit(key, file, chunk_files)
+        logger.info(f'Added {len(chunk_files)} chunks of {file} to the chunk cache')
+
+
+    # === Remove the temporary folder of a run ===
+    def remove_run_directories(self, chunk_files):
+        """
+        Removes the temporary folders of this cache that held the given chunks, once the caller has deleted them. The
+        cache keeps its own links to the chunks, so the empty folders would otherwise pile up until the orphan sweep.
+        Folders that still hold chunks, e.g. because `deleteUploadChunks` is off, are kept.
+        """
+        directories = {os.path.dirname(os.path.abspath(chunk_file)) for chunk_file in chunk_files if not isinstance(chunk_file, chunk_store.CachedChunk)}
+        for directory in directories:
+            if os.path.dirname(directory) == os.path.abspath(self.directory) and os.path.basename(directory).startswith(TEMP_PREFIX):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+
+# === Create the cache set in the settings ===
+def create_cache(chunk_cache_settings=None):
+    """
+    Returns the chunk cache configured by the `chunkCache` block of `settings.json`, or None if it is disabled:
+        - enabled (bool): Keep the chunks for later runs.
+        - directory (str): Folder of the cache.
+        - quotaMb (int): Disk space used by the cache before the least recently used entries are removed.
+        - leaseSeconds (int): Entries used within this time are not removed, as they may still be uploaded.
+    """
+    if not chunk_cache_settings or not chunk_cache_settings["enabled"]:
+        return None
+    return ChunkCache(chunk_cache_settings["directory"], chunk_cache_settings["quotaMb"] * 1024 * 1024,
+                      chunk_cache_settings["leaseSeconds"])
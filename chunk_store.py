@@ -0,0 +1,186 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module for the storage of upload chunks on disk, in a scratch directory or in memory
+# ===============================================================================
+
+import io
+import os
+import sys
+import logging
+import threading
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Chunk held in memory ===
+class MemoryChunk:
+    """
+    A chunk kept in memory by a `MemoryChunkStore`. Used in place of a chunk file path.
+    """
+
+    def __init__(self, name, data, store):
+        self.name = name
+        self.data = data
+        self.store = store
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    # === Return the memory to the store's budget ===
+    def release(self):
+        if self.data is not None:
+            self.store.release(self.size)
+            self.data = None
+
+    def __str__(self):
+        return f'memory:{self.name}'
+
+
+# === Chunk file owned by the chunk cache ===
+class CachedChunk(str):
+    """
+    The path of a chunk file kept by `chunk_cache.ChunkCache` for later runs. `file_ops.delete_files` keeps it.
+    """
+
+
+# === Chunk helpers accepting paths and memory chunks ===
+def read_chunk(chunk):
+    """
+    Returns the content of a chunk, either a chunk file path or a `MemoryChunk`.
+    """
+    if isinstance(chunk, MemoryChunk):
+        return chunk.data
+    with open(chunk, 'rb') as chunk_file:
+        return chunk_file.read()
+
+
+def chunk_size(chunk):
+    """
+    Returns the size in bytes of a chunk, either a chunk file path or a `MemoryChunk`.
+    """
+    if isinstance(chunk, MemoryChunk):
+        return chunk.size
+    return os.path.getsize(chunk)
+
+
+# === Chunk being written ===
+class PendingChunk:
+    """
+    A chunk being written to `file`, a binary file object. `commit` closes it and returns the chunk, which is
+    the path of the chunk file or a `MemoryChunk`.
+    """
+
+    def __init__(self, file, commit):
+        self.file = file
+        self._commit = commit
+
+    def commit(self):
+        return self._commit()
+
+
+class _MemoryChunkFile(io.BytesIO):
+    """
+    Keeps the content when closed, as wrapping text or gzip streams close the buffer with them.
+    """
+
+    def close(self):
+        if not self.closed:
+            self.data = self.getvalue()
+        super().close()
+
+
+# === Disk store ===
+class DiskChunkStore:
+    """
+    Writes chunk files next to the source file, or into `directory` if set, e.g. a local disk or a tmpfs mount such
+    as `/dev/shm` when the source is on a slow network volume.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, source_directory, chunk_name):
+        return os.path.join(self.directory or source_directory, chunk_name)
+
+    # === Start writing a chunk ===
+    def create(self, source_directory, chunk_name):
+        path = self.path(source_directory, chunk_name)
+        file = open(path, 'wb')
+
+        def commit():
+            file.close()
+            return path
+
+        return PendingChunk(file, commit)
+
+
+# === Memory store ===
+class MemoryChunkStore(DiskChunkStore):
+    """
+    Keeps chunks in memory up to `budget_bytes` in total. A chunk that does not fit into the remaining budget is
+    spilled to a chunk file like `DiskChunkStore` does. Deleting a chunk with `file_ops.delete_files` returns its
+    memory to the budget.
+
+    The budget is checked once a chunk is complete, so each chunking thread may hold one chunk beyond it.
+    """
+
+    def __init__(self, budget_bytes, directory=None):
+        super().__init__(directory)
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.spilled = 0
+        self.lock = threading.Lock()
+
+    # === Start writing a chunk ===
+    def create(self, source_directory, chunk_name):
+        file = _MemoryChunkFile()
+
+        def commit():
+            file.close()
+            with self.lock:
+                if self.used_bytes + len(file.data) <= self.budget_bytes:
+                    self.used_bytes += len(file.data)
+                    return MemoryChunk(chunk_name, file.data, self)
+                self.spilled += 1
+
+            # Over budget, write the chunk to disk instead
+            path = self.path(source_directory, chunk_name)
+            with open(path, 'wb') as chunk_file:
+                chunk_file.write(file.data)
+            logger.info(f'Memory budget of {self.budget_bytes} bytes reached, spilled chunk to {path}')
+            return path
+
+        return PendingChunk(file, commit)
+
+    def release(self, size):
+        with self.lock:
+            self.used_bytes -= size
+
+
+# === Create the store set in the settings ===
+def create_store(chunk_store_settings=None):
+    """
+    Returns the chunk store configured by the `chunkStore` block of `settings.json`:
+        - backend (str): `disk` (default) or `memory`.
+        - scratchDirectory (str): Folder for chunk files. Empty writes them next to the source file.
+        - memoryBudgetMb (int): Total size of the chunks kept in memory by the `memory` backend.
+    """
+    if not chunk_store_settings:
+        return DiskChunkStore()
+
+    match chunk_store_settings["backend"]:
+        case "memory":
+            return MemoryChunkStore(chunk_store_settings["memoryBudgetMb"] * 1024 * 1024, chunk_store_settings["scratchDirectory"])
+        case "disk":
+            return DiskChunkStore(chunk_store_settings["scratchDirectory"])
+        case _:
+            logger.error(f'Unknown chunk store backend `{chunk_store_settings["backend"]}`')
+            print(f'Please update the settings with a `chunkStore` backend of `disk` or `memory`')
+            sys.exit(1)
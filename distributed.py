@@ -0,0 +1,325 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module to upload a single large file from several hosts (coordinator and workers)
+# ===============================================================================
+
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import anaplan_ops
+import file_ops
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Seconds a worker waits before asking again when every remaining assignment is leased to another worker
+POLL_INTERVAL = 5
+
+# The placeholder shipped in `settings.json`, which must be replaced before a coordinator is started
+DEFAULT_SHARED_SECRET = "change-me"
+
+
+# === Coordinator state ===
+class Coordinator:
+    """
+    Hands out ranges of chunk numbers to workers and tracks their completion.
+
+    Each assignment is leased to one worker. Assignments that are not reported back within `lease_seconds`
+    (e.g. the worker host died) or that failed are handed out again. Chunk PUTs are idempotent by chunk number,
+    so a late duplicate is harmless.
+    """
+
+    def __init__(self, file, file_id, boundaries, compress_upload_chunks, chunks_per_assignment, lease_seconds, max_attempts=3):
+        self.file = file
+        self.file_id = file_id
+        self.compress_upload_chunks = compress_upload_chunks
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.total_chunks = len(boundaries)
+        self.lock = threading.Lock()
+        self.done_event = threading.Event()
+        self.failed = False
+
+        # Split the chunk numbers into consecutive ranges
+        chunks = [[chunk_num, start, end] for chunk_num, (start, end) in enumerate(boundaries)]
+        self.queue = deque({"id": assignment_id, "chunks": chunks[index:index + chunks_per_assignment], "attempts": 0}
+                           for assignment_id, index in enumerate(range(0, len(chunks), chunks_per_assignment)))
+        self.assignments = {assignment["id"]: assignment for assignment in self.queue}
+        self.leases = {}         # assignment ID -> (assignment, worker, lease time)
+        self.completed = set()   # assignment IDs
+        self.worker_chunks = {}  # worker -> chunks uploaded
+
+        if not self.queue:
+            self.done_event.set()
+
+    # === Lease the next assignment ===
+    def next_assignment(self, worker):
+        with self.lock:
+            if self.done_event.is_set():
+                return {"done": True}
+
+            # Hand out expired leases again
+            now = time.monotonic()
+            for assignment_id, (assignment, lease_worker, lease_time) in list(self.leases.items()):
+                if now - lease_time > self.lease_seconds:
+                    logger.warning(f'Lease of assignment {assignment_id} by {lease_worker} expired')
+                    del self.leases[assignment_id]
+                    self.queue.append(assignment)
+
+            # Skip assignments completed late by a worker whose lease had expired
+            while self.queue and self.queue[0]["id"] in self.completed:
+                self.queue.popleft()
+            if not self.queue:
+                return {"wait": POLL_INTERVAL}
+
+            assignment = self.queue.popleft()
+            assignment["attempts"] += 1
+            self.leases[assignment["id"]] = (assignment, worker, now)
+
+        logger.info(f'Assignment {assignment["id"]} (chunks {assignment["chunks"][0][0]}-{assignment["chunks"][-1][0]}) leased to {worker}')
+        print(f'Assignment {assignment["id"]} (chunks {assignment["chunks"][0][0]}-{assignment["chunks"][-1][0]}) leased to {worker}')
+        return {"assignmentId": assignment["id"], "fileId": self.file_id, "file": self.file,
+                "compressUploadChunks": self.compress_upload_chunks, "chunks": assignment["chunks"]}
+
+    # === Record a completed or failed assignment ===
+    def complete(self, worker, assignment_id, successful):
+        with self.lock:
+            lease = self.leases.pop(assignment_id, None)
+            if assignment_id in self.completed:
+                return
+
+            assignment = self.assignments[assignment_id]
+            if successful:
+                self.completed.add(assignment_id)
+                self.worker_chunks[worker] = self.worker_chunks.get(worker, 0) + len(assignment["chunks"])
+                logger.info(f'Assignment {assignment_id} completed by {worker}')
+            elif lease is None:
+                # The lease had expired and the assignment is already queued again
+                logger.warning(f'Assignment {assignment_id} failed on {worker} after its lease expired')
+            elif assignment["attempts"] < self.max_attempts:
+                logger.warning(f'Assignment {assignment_id} failed on {worker}, handing it out again')
+                self.queue.append(assignment)
+            else:
+                logger.error(f'Assignment {assignment_id} failed on {worker} after {self.max_attempts} attempts')
+                self.failed = True
+                self.done_event.set()
+
+            if len(self.completed) == len(self.assignments):
+                self.done_event.set()
+
+
+# === Coordinator HTTP endpoint ===
+class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints used by the workers: `POST /assignment` and `POST /complete`.
+    Requests must carry the shared secret in the `X-Shared-Secret` header. The endpoint speaks plain HTTP, so the
+    secret and the assignments cross the network unencrypted. Only listen on a trusted network.
+    """
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        if not hmac.compare_digest(self.headers.get('X-Shared-Secret', ''), self.server.shared_secret):
+            self.send_json(403, {"error": "Invalid shared secret"})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        match self.path:
+            case '/assignment':
+                self.send_json(200, coordinator.next_assignment(body["worker"]))
+            case '/complete':
+                coordinator.complete(body["worker"], body["assignmentId"], body["successful"])
+                self.send_json(200, {})
+            case _:
+                self.send_json(404, {"error": "Unknown endpoint"})
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Route the request log to the log file instead of stderr
+        logger.debug(format % args)
+
+
+# === Parse a HOST:PORT address ===
+# Without a host the coordinator only listens on this host, other hosts need an explicit address such as `0.0.0.0`
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+# === Run the coordinator ===
+def run_coordinator(file, address, chunk_size_mb, compress_upload_chunks, distributed_settings, local_workers=0, worker_args=None,
+                    worker_environment=None, use_line_index=False, **kwargs):
+    """
+    Resolves the file ID, sets the chunk count once, and serves chunk ranges to the workers until every chunk
+    has been uploaded.
+
+    Args:
+        file (str): The path of the uncompressed file to upload. Workers may pass their own path to the same file.
+        address (str): The `HOST:PORT` to listen on. `:PORT` only accepts workers on this host.
+        chunk_size_mb (int): The maximum size of each chunk in megabytes.
+        compress_upload_chunks (bool): Flag to toggle GZip compression on or off.
+        distributed_settings (dict): The `distributed` block from `settings.json`.
+        local_workers (int): Number of worker processes to start on this host, for testing.
+        worker_args (list): Extra command line arguments for the local workers (e.g. the user name).
+        worker_environment (dict): Extra environment variables for the local workers (e.g. the password).
+        use_line_index (bool): Find the chunk boundaries in the sidecar line index instead of reading the file.
+        **kwargs: Keyword arguments passed to `anaplan_ops` (base URI, workspace ID, model ID, ...).
+
+    Returns:
+        bool: True if every chunk was uploaded, False if a chunk failed or the upload timed out.
+    """
+    # Anyone who knows the secret can lease assignments and report them as completed
+    if distributed_settings["sharedSecret"] in ("", DEFAULT_SHARED_SECRET):
+        logger.error("The coordinator was not started because the `sharedSecret` is not set")
+        print("Please update the `distributed` settings in the `settings.json` file with your own `sharedSecret`")
+        sys.exit(1)
+
+    if file_ops.detect_compression(file):
+        logger.error("Distributed uploads need an uncompressed file so workers can seek to their byte ranges")
+        print("Distributed uploads need an uncompressed file so workers can seek to their byte ranges")
+        sys.exit(1)
+
+    boundaries = file_ops.compute_chunk_boundaries(file, chunk_size_mb, use_line_index=use_line_index)
+    file_id = anaplan_ops.fetch_file_id(file_to_upload=file, **kwargs)
+    anaplan_ops.set_chunk_count(len(boundaries), file_id, **kwargs)
+
+    coordinator = Coordinator(file=os.path.abspath(file), file_id=file_id, boundaries=boundaries,
+                              compress_upload_chunks=compress_upload_chunks,
+                              chunks_per_assignment=distributed_settings["chunksPerAssignment"],
+                              lease_seconds=distributed_settings["leaseSeconds"])
+
+    server = ThreadingHTTPServer(parse_address(address), CoordinatorRequestHandler)
+    server.coordinator = coordinator
+    server.shared_secret = distributed_settings["sharedSecret"]
+    threading.Thread(target=server.serve_forever, name="Coordinator", daemon=True).start()
+    logger.info(f'Coordinator listening on {address} for {len(boundaries)} chunks of file ID {file_id}')
+    print(f'Coordinator listening on {address} for {len(boundaries)} chunks of file ID {file_id}')
+
+    # Start local worker processes, mainly for testing
+    processes = []
+    for _ in range(local_workers):
+        host, port = parse_address(address)
+        worker_address = f'{"127.0.0.1" if host == "0.0.0.0" else host}:{port}'
+        processes.append(subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'),
+                                           '--worker', worker_address, '-f', file] + (worker_args or []),
+                                          env={**os.environ, **(worker_environment or {})}))
+
+    # Give up if the workers have not uploaded every chunk in time, e.g. because none of them is running
+    timeout_seconds = distributed_settings["timeoutSeconds"]
+    if not coordinator.done_event.wait(timeout_seconds or None):
+        logger.error(f'Distributed upload of file ID {file_id} timed out after {timeout_seconds} seconds')
+        print(f'Distributed upload of file ID {file_id} timed out after {timeout_seconds} seconds')
+        coordinator.failed = True
+        for process in processes:
+            process.terminate()
+
+    # Keep answering for a moment so polling workers learn that the upload is done
+    time.sleep(POLL_INTERVAL)
+    server.shutdown()
+    for process in processes:
+        process.wait()
+
+    for worker, chunk_count in sorted(coordinator.worker_chunks.items()):
+        logger.info(f'Worker {worker} uploaded {chunk_count} chunks')
+        print(f'Worker {worker} uploaded {chunk_count} chunks')
+
+    if coordinator.failed:
+        logger.error(f'Distributed upload of file ID {file_id} failed')
+        print(f'Distributed upload of file ID {file_id} failed')
+        return False
+
+    logger.info(f'Distributed upload of {len(boundaries)} chunks to file ID {file_id} complete')
+    print(f'Distributed upload of {len(boundaries)} chunks to file ID {file_id} complete')
+    return True
+
+
+# === Run a worker ===
+def run_worker(address, shared_secret, max_workers, file=None, **kwargs):
+    """
+    Requests chunk ranges from the coordinator, chunks the byte ranges of the shared file and uploads them to the
+    file ID chosen by the coordinator, until the coordinator reports that the upload is done.
+
+    Args:
+        address (str): The `HOST:PORT` of the coordinator.
+        shared_secret (str): The secret shared with the coordinator.
+        max_workers (int): Number of upload threads.
+        file (str, optional): The local path of the shared file, if it differs from the coordinator's path.
+        **kwargs: Keyword arguments passed to `anaplan_ops.upload_chunk` (base URI, workspace ID, model ID, ...).
+    """
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    headers = {'X-Shared-Secret': shared_secret}
+    base_uri = f'http://{address}'
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload") as executor, \
+            tempfile.TemporaryDirectory() as directory:
+        while True:
+            try:
+                res = requests.post(f'{base_uri}/assignment', json={"worker": worker}, headers=headers, timeout=30)
+                res.raise_for_status()
+            except requests.exceptions.ConnectionError:
+                # The coordinator shuts down once every chunk has been uploaded
+                logger.info("Coordinator is no longer available, stopping the worker")
+                break
+            except requests.exceptions.RequestException as err:
+                # E.g. a 403 because the `sharedSecret` differs from the coordinator's
+                logger.error(f'Coordinator at {address} refused the assignment request: {err}')
+                print(f'Coordinator at {address} refused the assignment request: {err}. Check that the `sharedSecret` in the `settings.json` file matches the coordinator')
+                sys.exit(1)
+            assignment = res.json()
+
+            if assignment.get("done"):
+                break
+            if "wait" in assignment:
+                time.sleep(assignment["wait"])
+                continue
+
+            source_file = file or assignment["file"]
+            compress_upload_chunks = assignment["compressUploadChunks"]
+            _, file_base_name, file_extension = file_ops.split_source_name(source_file)
+
+            def upload_range(chunk_num, start, end):
+                chunk_file_path = file_ops.build_chunk_path(directory, file_base_name, file_extension, chunk_num, compress_upload_chunks)
+                file_ops.write_chunk_range(source_file, start, end, chunk_file_path, compress_upload_chunks)
+                try:
+                    anaplan_ops.upload_chunk(chunk_file_path, assignment["fileId"], chunk_num, compress_upload_chunks=compress_upload_chunks, **kwargs)
+                finally:
+                    os.remove(chunk_file_path)
+
+            futures = [executor.submit(upload_range, *chunk) for chunk in assignment["chunks"]]
+            successful = True
+            for future in futures:
+                # `upload_chunk` raises `anaplan_ops.ChunkUploadError` once its retries are exhausted
+                if future.exception() is not None:
+                    logger.error(f'Chunk upload failed: {future.exception()!r}')
+                    successful = False
+
+            try:
+                requests.post(f'{base_uri}/complete', json={"worker": worker, "assignmentId": assignment["assignmentId"], "successful": successful},
+                              headers=headers, timeout=30).raise_for_status()
+            except requests.exceptions.RequestException as err:
+                # The coordinator hands the assignment out again once its lease expires
+                logger.error(f'Assignment {assignment["assignmentId"]} could not be reported to the coordinator at {address}: {err}')
+                print(f'Assignment {assignment["assignmentId"]} could not be reported to the coordinator at {address}: {err}')
+                sys.exit(1)
+            logger.info(f'Assignment {assignment["assignmentId"]} reported as {"completed" if successful else "failed"}')
+            print(f'Assignment {assignment["assignmentId"]} reported as {"completed" if successful else "failed"}')
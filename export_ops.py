@@ -0,0 +1,238 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module to download Anaplan exports and convert them to columnar files while the chunks arrive
+# ===============================================================================
+
+import io
+import os
+import sys
+import csv
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import anaplan_ops
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === List the chunks of a file ===
+def get_chunk_ids(file_id, **kwargs):
+    """
+    Returns the chunk IDs of a file in Anaplan, e.g. the output of an export, in order.
+    """
+    uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files/{file_id}/chunks'
+    res = anaplan_ops.anaplan_api(uri=uri, verb="GET", verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
+    return [chunk['id'] for chunk in json.loads(res.text).get('chunks', [])]
+
+
+# === Download a chunk ===
+def download_chunk(file_id, chunk_id, **kwargs):
+    """
+    Returns the content of a chunk of a file in Anaplan as bytes.
+    """
+    uri = f'{kwargs["base_uri"]}/workspaces/{kwargs["workspace_id"]}/models/{kwargs["model_id"]}/files/{file_id}/chunks/{chunk_id}'
+    res = anaplan_ops.anaplan_api(uri=uri, verb="GET", accept='application/octet-stream', verbose_endpoint_logging=kwargs["verbose_endpoint_logging"], retry_count=kwargs["retry_count"], auth=kwargs.get("auth"), client=kwargs.get("client"))
+    return res.content
+
+
+# === Split off the last incomplete record ===
+def split_complete_records(data, quote=b'"'):
+    """
+    Splits a buffer after the last line break that is not inside a quoted field.
+
+    Returns:
+        tuple: The complete records and the remainder to carry into the next chunk.
+    """
+    cut = data.rfind(b'\n')
+    while cut >= 0 and data.count(quote, 0, cut) % 2:
+        cut = data.rfind(b'\n', 0, cut)
+    return data[:cut + 1], data[cut + 1:]
+
+
+# === Parquet output ===
+class ParquetBatchWriter:
+    """
+    Parses each batch with `pyarrow.csv` and appends it to a Parquet file as a row group.
+    """
+
+    def __init__(self, path, columns, dtypes, default_dtype, delimiter):
+        import numpy as np
+        try:
+            import pyarrow
+            import pyarrow.csv
+            import pyarrow.parquet
+        except ImportError:
+            print("The `parquet` export format requires the `pyarrow` library. Please run `pip install pyarrow`")
+            logger.error("The `parquet` export format requires the `pyarrow` library")
+            sys.exit(1)
+
+        self.pa = pyarrow
+        self.path = f'{path}.parquet'
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Every column has a fixed type so all row groups share one schema
+        column_types = {column: pyarrow.from_numpy_dtype(np.dtype(dtypes.get(column, default_dtype))) for column in columns}
+        self.read_options = pyarrow.csv.ReadOptions(column_names=columns)
+        self.parse_options = pyarrow.csv.ParseOptions(delimiter=delimiter, newlines_in_values=True)
+        self.convert_options = pyarrow.csv.ConvertOptions(column_types=column_types, strings_can_be_null=False)
+        self.writer = None
+        self.rows = 0
+
+    def write(self, data):
+        table = self.pa.csv.read_csv(io.BytesIO(data), read_options=self.read_options,
+                                     parse_options=self.parse_options, convert_options=self.convert_options)
+        if self.writer is None:
+            self.writer = self.pa.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        return self.path
+
+
+# === NumPy output ===
+class NumpyBatchWriter:
+    """
+    Parses each batch with pandas and appends every column as raw values of its declared dtype to `<column>.bin`.
+    A `schema.json` lists the dtype, file and row count of each column, so a column can be loaded with
+    `numpy.fromfile(file, dtype)` or memory-mapped with `numpy.memmap`.
+
+    Strings are stored with a fixed width, e.g. `U32`, and longer values are truncated.
+    """
+
+    def __init__(self, path, columns, dtypes, default_dtype, delimiter):
+        import numpy as np
+        self.path = path
+        self.columns = columns
+        self.dtypes = {column: np.dtype(dtypes.get(column, default_dtype)) for column in columns}
+        self.delimiter = delimiter
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        self.files = {column: open(os.path.join(path, f'{index:03d}_{column_file_name(column)}.bin'), 'wb')
+                      for index, column in enumerate(columns)}
+
+    def write(self, data):
+        import pandas as pd
+        frame = pd.read_csv(io.BytesIO(data), sep=self.delimiter, names=self.columns, header=None, dtype=str,
+                            keep_default_na=False, na_filter=False, encoding='utf-8')
+        for column in self.columns:
+            convert_column(frame[column], self.dtypes[column]).tofile(self.files[column])
+        self.rows += len(frame)
+
+    def close(self):
+        schema = {}
+        for column, file in self.files.items():
+            file.close()
+            schema[column] = {"dtype": self.dtypes[column].str, "file": os.path.basename(file.name), "rows": self.rows}
+        with open(os.path.join(self.path, 'schema.json'), 'w', encoding='utf-8') as schema_file:
+            json.dump(schema, schema_file, indent=4)
+        return self.path
+
+
+def column_file_name(column):
+    return ''.join(character if character.isalnum() else '_' for character in column)
+
+
+# === Convert a column of strings to its declared dtype ===
+def convert_column(values, dtype):
+    """
+    Converts a column read as strings. Empty numbers become NaN for floats and raise for integers.
+    """
+    import numpy as np
+    import pandas as pd
+    match dtype.kind:
+        case 'f':
+            return pd.to_numeric(values.replace('', np.nan)).to_numpy(dtype=dtype)
+        case 'i' | 'u':
+            return pd.to_numeric(values).to_numpy(dtype=dtype)
+        case 'b':
+            return values.str.lower().isin(['true', '1', 'yes']).to_numpy(dtype=dtype)
+        case 'M':
+            return pd.to_datetime(values).to_numpy(dtype=dtype)
+        case _:
+            return values.to_numpy(dtype=dtype)
+
+
+BATCH_WRITERS = {
+    "parquet": ParquetBatchWriter,
+    "numpy": NumpyBatchWriter,
+}
+
+
+# === Download and convert an export ===
+def download_export(file_id, output_path, export_settings, max_workers, **kwargs):
+    """
+    Downloads the chunks of an export concurrently and converts them to columnar batches in chunk order. Each chunk
+    is parsed as soon as it and the chunks before it have arrived, while the following chunks are still downloading.
+    At most `2 * max_workers` chunks are held in memory, so memory is bounded by the chunk size, not the file size.
+
+    A record split across two chunks is carried over to the next chunk. The header of the first chunk names the
+    columns.
+
+    Args:
+        file_id (str): The ID of the export file in Anaplan (the export ID).
+        output_path (str): The path of the output without extension. Parquet adds `.parquet`, NumPy creates a folder.
+        export_settings (dict): The `export` block from `settings.json`:
+            - format (str): `parquet` (requires `pyarrow`) or `numpy`.
+            - dtypes (dict): NumPy dtype per column, e.g. `{"Amount": "float64"}`.
+            - defaultDtype (str): The dtype of the other columns, e.g. `U64`.
+            - delimiter (str): The field delimiter.
+        max_workers (int): Number of download threads.
+        **kwargs: Keyword arguments passed to `anaplan_ops` (base URI, workspace ID, model ID, ...).
+
+    Returns:
+        str: The path of the Parquet file or NumPy folder.
+    """
+    chunk_ids = get_chunk_ids(file_id, **kwargs)
+    logger.info(f'Downloading {len(chunk_ids)} chunks of file ID {file_id}')
+    print(f'Downloading {len(chunk_ids)} chunks of file ID {file_id}')
+
+    writer = None
+    carry = b''
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download") as executor:
+        pending = deque()
+        chunk_iter = iter(chunk_ids)
+
+        # Keep a bounded number of downloads in flight ahead of the chunk being parsed
+        for chunk_id in chunk_iter:
+            pending.append(executor.submit(download_chunk, file_id, chunk_id, **kwargs))
+            if len(pending) >= 2 * max_workers:
+                break
+
+        while pending:
+            data = carry + pending.popleft().result()
+            next_chunk_id = next(chunk_iter, None)
+            if next_chunk_id is not None:
+                pending.append(executor.submit(download_chunk, file_id, next_chunk_id, **kwargs))
+
+            # Parse the complete records, the last chunk has no remainder
+            if pending:
+                data, carry = split_complete_records(data)
+            else:
+                carry = b''
+
+            if writer is None:
+                header, _, data = data.partition(b'\n')
+                columns = next(csv.reader([header.decode('utf-8').rstrip('\r')], delimiter=export_settings["delimiter"]))
+                writer = BATCH_WRITERS[export_settings["format"]](output_path, columns, export_settings["dtypes"],
+                                                                  export_settings["defaultDtype"], export_settings["delimiter"])
+            if data.strip():
+                writer.write(data)
+            logger.info(f'Converted {writer.rows} rows')
+
+    if writer is None:
+        logger.error(f'File ID {file_id} has no chunks')
+        print(f'File ID {file_id} has no chunks')
+        sys.exit(1)
+
+    path = writer.close()
+    logger.info(f'Export of file ID {file_id} written to {path}: {writer.rows} rows')
+    print(f'Export of file ID {file_id} written to {path}: {writer.rows} rows')
+    return path
@@ -0,0 +1,284 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module for the pooled HTTP/1.1 and HTTP/2 transports used by the Anaplan REST API
+# ===============================================================================
+
+import sys
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Shared client used by `anaplan_ops.anaplan_api`
+_client = None
+_client_lock = threading.Lock()
+
+# Used when no `timeouts` block is passed. A minimum upload rate of 0 turns the stall watchdog off
+DEFAULT_TIMEOUTS = {"connectSeconds": 10, "readSeconds": 300, "minUploadKbPerSecond": 0, "stallGraceSeconds": 30}
+_timeouts = DEFAULT_TIMEOUTS
+
+
+# === Stall watchdog ===
+class UploadStalledError(requests.exceptions.ConnectionError):
+    """
+    Raised when a request body is sent slower than the configured minimum rate. It is a connection error, so the
+    request is retried like any other dropped connection.
+    """
+
+
+class WatchedBody:
+    """
+    File-like request body that checks the transfer rate each time the transport reads the next block. The rate is
+    measured over windows of `grace_seconds`, so a burst into the socket buffers at the start does not hide a stall.
+
+    A socket that accepts no data at all is caught by the connect and read timeouts, which also bound a single blocked
+    socket write. This catches connections that are still alive but send a large chunk so slowly that it would take
+    hours.
+
+    `requests` reads the body with `read`, `httpx` iterates over it in blocks of `BLOCK_SIZE` bytes. Either way the
+    rate is checked before each block.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, data, min_bytes_per_second, grace_seconds):
+        self.data = memoryview(data)
+        self.position = 0
+        self.min_bytes_per_second = min_bytes_per_second
+        self.grace_seconds = grace_seconds
+        self.window_start = None     # Monotonic time at which the current measurement window started
+        self.window_position = 0     # Bytes read at the start of the window
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        while block := self.read(self.BLOCK_SIZE):
+            yield block
+
+    def read(self, size=-1):
+        now = time.monotonic()
+        if self.window_start is None:
+            self.window_start = now
+
+        # Judge the rate once per window, so slow starts (TCP slow start, TLS) are not flagged
+        elapsed = now - self.window_start
+        if elapsed >= self.grace_seconds and self.position < len(self.data):
+            rate = (self.position - self.window_position) / elapsed
+            if rate < self.min_bytes_per_second:
+                logger.warning(f'Upload stalled: {rate / 1024:.1f} KB/s over the last {elapsed:.0f}s, '
+                               f'{self.position} of {len(self.data)} bytes sent')
+                raise UploadStalledError(f'Upload stalled at {rate / 1024:.1f} KB/s')
+            self.window_start = now
+            self.window_position = self.position
+
+        if size is None or size < 0:
+            size = len(self.data) - self.position
+        block = self.data[self.position:self.position + size].tobytes()
+        self.position += len(block)
+        return block
+
+
+def watch_body(data, timeouts):
+    """
+    Wraps a `bytes` request body in a `WatchedBody` when the stall watchdog is enabled, otherwise returns it as-is.
+    """
+    if not isinstance(data, bytes) or not timeouts["minUploadKbPerSecond"]:
+        return data
+    return WatchedBody(data, timeouts["minUploadKbPerSecond"] * 1024, timeouts["stallGraceSeconds"])
+
+
+# === HTTP/1.1 transport ===
+class Http1Client:
+    """
+    Pooled HTTP/1.1 transport backed by a `requests.Session`.
+
+    Each concurrent upload needs its own TCP+TLS connection, so the pool is sized to the thread count.
+    """
+
+    def __init__(self, max_connections=10, timeouts=None):
+        self.timeouts = timeouts or DEFAULT_TIMEOUTS
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, verb, uri, headers=None, data=None, json=None):
+        return self.session.request(verb, uri, headers=headers, data=watch_body(data, self.timeouts), json=json,
+                                    timeout=(self.timeouts["connectSeconds"], self.timeouts["readSeconds"]))
+
+    def close(self):
+        self.session.close()
+
+
+# === HTTP/2 transport ===
+class Http2Client:
+    """
+    HTTP/2 transport backed by `httpx`, multiplexing concurrent requests as streams over a few connections.
+
+    Errors are translated into the `requests` exception hierarchy so callers can handle both transports alike.
+    """
+
+    def __init__(self, max_connections=4, prior_knowledge=False, timeouts=None):
+        try:
+            import httpx
+        except ImportError:
+            print("The `http2` transport requires the `httpx[http2]` library. Please run `pip install httpx[http2]`")
+            logger.error("The `http2` transport requires the `httpx[http2]` library")
+            sys.exit(1)
+
+        self.httpx = httpx
+        self.timeouts = timeouts or DEFAULT_TIMEOUTS
+        # Prior knowledge (h2c) is only needed for plain `http://` endpoints such as a local stand-in server
+        self.client = httpx.Client(
+            http1=not prior_knowledge,
+            http2=True,
+            timeout=httpx.Timeout(self.timeouts["readSeconds"], connect=self.timeouts["connectSeconds"], pool=None),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+
+    def request(self, verb, uri, headers=None, data=None, json=None):
+        data = watch_body(data, self.timeouts)
+        if isinstance(data, WatchedBody):
+            # httpx would otherwise send a file-like body with chunked transfer encoding
+            headers = {**(headers or {}), 'Content-Length': str(len(data))}
+        try:
+            res = self.client.request(verb, uri, headers=headers, content=data, json=json)
+        except self.httpx.TimeoutException as err:
+            raise requests.exceptions.Timeout(str(err))
+        except self.httpx.TransportError as err:
+            raise requests.exceptions.ConnectionError(str(err))
+        return Http2Response(res)
+
+    def close(self):
+        self.client.close()
+
+
+class Http2Response:
+    """
+    Thin wrapper exposing the parts of `requests.Response` used in this project for an `httpx.Response`.
+    """
+
+    def __init__(self, res):
+        self._res = res
+        self.status_code = res.status_code
+        self.headers = res.headers
+        self.http_version = res.http_version
+
+    @property
+    def text(self):
+        return self._res.text
+
+    @property
+    def content(self):
+        return self._res.content
+
+    def json(self):
+        return self._res.json()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                f'{self.status_code} Error: {self._res.reason_phrase} for url: {self._res.url}', response=self)
+
+
+# === Create a transport ===
+def create_client(transport="requests", max_connections=10, prior_knowledge=False, timeouts=None):
+    """
+    Creates an HTTP client for the requested transport.
+
+    Args:
+        transport (str): Either `requests` (HTTP/1.1) or `http2`.
+        max_connections (int): Maximum number of pooled connections.
+        prior_knowledge (bool): Speak HTTP/2 over plain `http://` without negotiation. Only used by `http2`.
+        timeouts (dict, optional): The `timeouts` block from `settings.json`. Defaults to `DEFAULT_TIMEOUTS`.
+
+    Returns:
+        Http1Client or Http2Client: The HTTP client.
+    """
+    match transport:
+        case "requests":
+            return Http1Client(max_connections=max_connections, timeouts=timeouts)
+        case "http2":
+            return Http2Client(max_connections=max_connections, prior_knowledge=prior_knowledge, timeouts=timeouts)
+        case _:
+            print(f"Unknown `httpTransport` value `{transport}`. Please update the `settings.json` file with either `requests` or `http2`")
+            logger.error(f"Unknown `httpTransport` value `{transport}`")
+            sys.exit(1)
+
+
+# === Configure the shared transport ===
+def configure(transport="requests", max_connections=10, timeouts=None):
+    """
+    Replaces the shared HTTP client used by `anaplan_ops.anaplan_api`.
+
+    Args:
+        transport (str): Either `requests` (HTTP/1.1) or `http2`.
+        max_connections (int): Maximum number of pooled connections.
+        timeouts (dict, optional): The `timeouts` block from `settings.json`, also used by the authentication modules.
+    """
+    global _client, _timeouts
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _timeouts = timeouts or DEFAULT_TIMEOUTS
+        _client = create_client(transport=transport, max_connections=max_connections, timeouts=_timeouts)
+    logger.info(f'HTTP transport set to `{transport}` with up to {max_connections} connections')
+
+
+# === Get the shared transport ===
+def get_client():
+    """
+    Returns the shared HTTP client, creating a default HTTP/1.1 pool on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = create_client()
+        return _client
+
+
+# === Get the configured timeouts ===
+def get_timeout():
+    """
+    Returns the `(connect, read)` timeout for requests that do not go through the shared client, e.g. authentication.
+    """
+    return (_timeouts["connectSeconds"], _timeouts["readSeconds"])
+
+
+# === Open connections ahead of the first upload ===
+def prewarm(uri, connections, client=None):
+    """
+    Opens pooled connections to the host of `uri` with concurrent `HEAD` requests, so the TCP and TLS handshakes are
+    done before the first chunk is ready. The response status is ignored, only the open connection matters.
+
+    Args:
+        uri (str): Any URI on the host to connect to, e.g. the Integration API base URI.
+        connections (int): Number of concurrent requests, at most the size of the pool.
+        client (Http1Client or Http2Client, optional): The HTTP client. Defaults to the shared transport.
+
+    Returns:
+        int: The number of requests that reached the host.
+    """
+    if client is None:
+        client = get_client()
+
+    def head():
+        try:
+            client.request('HEAD', uri)
+            return True
+        except requests.exceptions.RequestException as err:
+            logger.warning(f'Connection pre-warm to {uri} failed: {err}')
+            return False
+
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="prewarm") as executor:
+        opened = sum(executor.map(lambda _: head(), range(connections)))
+    logger.info(f'Pre-warmed {opened} of {connections} connections to {uri}')
+    return opened
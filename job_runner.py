@@ -0,0 +1,212 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module to run a declarative job of dependent uploads, imports and processes
+# ===============================================================================
+
+import sys
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import anaplan_ops
+import chunk_store
+import chunk_cache
+import upload_pipeline
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Supported step types
+STEP_TYPES = ("upload", "import", "process")
+
+
+# === Load and validate a job file ===
+def load_job(job_file):
+    """
+    Reads a job file and checks that every dependency exists and that there are no cycles.
+
+    A job file lists steps, each with a unique `id`, a `type` of `upload`, `import` or `process`, and an optional
+    `dependsOn` list of step IDs. Upload steps set `file` and optionally `importDataSource`, import steps set
+    `importId` and process steps set `processId`. The optional `maxParallelSteps` limits the concurrent steps.
+
+    Args:
+        job_file (str): The path of the job file.
+
+    Returns:
+        dict: The job with the steps keyed by ID, in dependency order.
+    """
+    try:
+        with open(job_file, 'r', encoding='utf-8') as file:
+            job = json.load(file)
+    except (OSError, json.JSONDecodeError) as err:
+        logger.error(f"Unable to read the job file {job_file}: {err}")
+        print(f"Unable to read the job file {job_file}: {err}")
+        sys.exit(1)
+
+    steps = {}
+    for step in job["steps"]:
+        if step["id"] in steps:
+            raise ValueError(f'Duplicate step ID `{step["id"]}`')
+        if step["type"] not in STEP_TYPES:
+            raise ValueError(f'Step `{step["id"]}` has an unsupported type `{step["type"]}`')
+        step.setdefault("dependsOn", [])
+        steps[step["id"]] = step
+
+    for step in steps.values():
+        for dependency in step["dependsOn"]:
+            if dependency not in steps:
+                raise ValueError(f'Step `{step["id"]}` depends on unknown step `{dependency}`')
+
+    # Order the steps topologically, which also detects cycles
+    ordered = {}
+    while len(ordered) < len(steps):
+        ready = [step_id for step_id, step in steps.items()
+                 if step_id not in ordered and all(dependency in ordered for dependency in step["dependsOn"])]
+        if not ready:
+            raise ValueError(f'The job has a dependency cycle between {sorted(set(steps) - set(ordered))}')
+        for step_id in ready:
+            ordered[step_id] = steps[step_id]
+
+    job["steps"] = ordered
+    return job
+
+
+# === Run a single step ===
+def run_step(step, settings, chunk_executor, store=None, cache=None, **kwargs):
+    """
+    Runs an upload, import or process step. Uploads share `chunk_executor`, the chunk `store` and the chunk `cache`
+    with the other upload steps.
+    """
+    match step["type"]:
+        case "upload":
+            pipeline = upload_pipeline.UploadPipeline(step["file"], settings, import_data_source=step.get("importDataSource"),
+                                                      store=store, cache=cache)
+            validation_errors = pipeline.validate()
+            if validation_errors:
+                raise ValueError(f'{step["file"]} failed validation with {len(validation_errors)} errors, first on line {validation_errors[0][0]}')
+            try:
+                pipeline.prepare()
+                chunk_files = pipeline.write_chunks()
+                anaplan_ops.upload_all_chunks(file_to_upload=step["file"], import_data_source=step.get("importDataSource"),
+                                              chunk_files=chunk_files, compress_upload_chunks=settings["compressUploadChunks"],
+                                              max_workers=settings["threadCount"], executor=chunk_executor, **kwargs)
+                pipeline.finish()
+            finally:
+                # Delete the chunks and the transformed file of a failed upload as well
+                pipeline.cleanup()
+        case "import":
+            anaplan_ops.run_action("imports", step["importId"], **kwargs)
+        case "process":
+            anaplan_ops.run_action("processes", step["processId"], **kwargs)
+
+
+# === Run a job ===
+def run_job(job_file, settings, **kwargs):
+    """
+    Runs the steps of a job file, starting each step as soon as all of its dependencies have completed.
+    Independent steps run concurrently. Chunk uploads of all upload steps share one thread pool.
+
+    If a step fails, no new steps are started. Steps that are already running finish, and the remaining steps are
+    reported as skipped.
+
+    Args:
+        job_file (str): The path of the job file.
+        settings (dict): The configuration settings.
+        **kwargs: Keyword arguments passed to `anaplan_ops` (base URI, workspace ID, model ID, ...).
+
+    Returns:
+        bool: True if every step completed.
+    """
+    try:
+        job = load_job(job_file)
+    except (KeyError, ValueError) as err:
+        logger.error(f"Invalid job file {job_file}: {err}")
+        print(f"Invalid job file {job_file}: {err}")
+        sys.exit(1)
+
+    steps = job["steps"]
+    pending = {step_id: set(step["dependsOn"]) for step_id, step in steps.items()}
+    timings = {}   # step ID -> (start, end) in seconds from the job start
+    failed = []
+    running = {}   # future -> step ID
+    job_start = time.perf_counter()
+    store = chunk_store.create_store(settings["chunkStore"])
+    cache = chunk_cache.create_cache(settings["chunkCache"])
+
+    # Step threads mostly wait on the network or on chunk futures, the chunk uploads run on their own pool
+    with ThreadPoolExecutor(max_workers=settings["threadCount"], thread_name_prefix="upload") as chunk_executor, \
+            ThreadPoolExecutor(max_workers=job.get("maxParallelSteps", 8), thread_name_prefix="step") as step_executor:
+
+        def start_ready_steps():
+            for step_id in [step_id for step_id, dependencies in pending.items() if not dependencies]:
+                del pending[step_id]
+                logger.info(f'Starting step `{step_id}`')
+                print(f'Starting step `{step_id}`')
+
+                def timed_step(step_id=step_id):
+                    # Time the step from when it runs, the time queued for a free step thread is not part of the step
+                    start = time.perf_counter() - job_start
+                    run_step(steps[step_id], settings, chunk_executor, store, cache, **kwargs)
+                    return start, time.perf_counter() - job_start
+
+                running[step_executor.submit(timed_step)] = step_id
+
+        start_ready_steps()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step_id = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    failed.append(step_id)
+                    logger.error(f'Step `{step_id}` failed: {error!r}')
+                    print(f'Step `{step_id}` failed: {error!r}')
+                    continue
+
+                timings[step_id] = future.result()
+                logger.info(f'Step `{step_id}` completed in {timings[step_id][1] - timings[step_id][0]:.2f} seconds')
+                print(f'Step `{step_id}` completed in {timings[step_id][1] - timings[step_id][0]:.2f} seconds')
+                for dependencies in pending.values():
+                    dependencies.discard(step_id)
+
+            # Stop scheduling after the first failure
+            if not failed:
+                start_ready_steps()
+
+    report_job(steps, timings, failed, time.perf_counter() - job_start)
+    return not failed
+
+
+# === Report the job timings and critical path ===
+def report_job(steps, timings, failed, total_time):
+    """
+    Prints the timing of every step and the critical path. The critical path is found by walking back from the
+    last step to finish, each time to the dependency that finished last and therefore gated the step's start.
+    """
+    logger.info(f'Job finished in {total_time:.2f} seconds')
+    print(f'\n{"Step":<24}{"Start (s)":>12}{"End (s)":>12}{"Duration (s)":>14}')
+    for step_id in steps:
+        if step_id in timings:
+            start, end = timings[step_id]
+            print(f'{step_id:<24}{start:>12.2f}{end:>12.2f}{end - start:>14.2f}')
+        else:
+            status = "failed" if step_id in failed else "skipped"
+            print(f'{step_id:<24}{status:>12}')
+            logger.warning(f'Step `{step_id}` {status}')
+
+    if timings:
+        critical_path = [max(timings, key=lambda step_id: timings[step_id][1])]
+        while True:
+            dependencies = [dependency for dependency in steps[critical_path[0]]["dependsOn"] if dependency in timings]
+            if not dependencies:
+                break
+            critical_path.insert(0, max(dependencies, key=lambda step_id: timings[step_id][1]))
+
+        path_time = timings[critical_path[-1]][1] - timings[critical_path[0]][0]
+        logger.info(f'Critical path: {" -> ".join(critical_path)} ({path_time:.2f} seconds)')
+        print(f'\nCritical path: {" -> ".join(critical_path)} ({path_time:.2f} seconds)')
+
+    print(f'Job finished in {total_time:.2f} seconds with {len(timings)} of {len(steps)} steps completed')
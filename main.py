@@ -5,6 +5,7 @@
 # Description:    Main module for invocation of Anaplan operations
 # ===============================================================================
 
+import os
 import sys
 import logging
 import utils
@@ -13,14 +14,29 @@ import anaplan_auth_api
 import anaplan_oauth
 import globals
 import anaplan_ops
-import file_ops
+import http_transport
+import profiler
+import calibration
+import job_runner
+import distributed
+import startup
+import chunk_store
+import parallel_gzip
+import chunk_cache
+import upload_pipeline
+import export_ops
 
 def main():
 
 	start_time = time.time()  # Record the start time
-	
-	# Clear the console
-	utils.clear_console()
+
+	# Get configurations from the CLI
+	args = utils.read_cli_arguments()
+	register = args.register
+
+	# Clear the console, except in workers started by a coordinator which share its console
+	if not args.worker:
+		utils.clear_console()
 
 	# Enable logging
 	logger = logging.getLogger(__name__)
@@ -35,16 +51,78 @@ def main():
 	thread_count = settings["threadCount"]
 	compress_upload_chunks = settings["compressUploadChunks"]
 	upload_chunk_size_mb = settings["uploadChunkSizeMb"]
-	delete_upload_chunks = settings["deleteUploadChunks"]
+	use_line_index = settings["useLineIndex"]
+	chunk_store_settings = settings["chunkStore"]
+	parallel_gzip_settings = settings["parallelGzip"]
+	chunk_cache_settings = settings["chunkCache"]
+	overlap_startup = settings["overlapStartup"]
 	database = settings["database"]
 	rotatable_token = settings["rotatableToken"]
 	access_token_ttl = settings["accessTokenTtl"]
 	workspace_id = settings["workspaceId"]
 	model_id = settings["modelId"]
+	http_transport_mode = settings["httpTransport"]
+	http2_max_connections = settings["http2MaxConnections"]
+	timeout_settings = settings["timeouts"]
+	export_settings = settings["export"]
+	calibration_settings = settings["calibration"]
+	distributed_settings = settings["distributed"]
+	hedge_settings = settings["hedgeUploads"]
 
-	# Get configurations from the CLI
-	args = utils.read_cli_arguments()
-	register = args.register
+	# Use the settings found by a previous calibration run for this model and host instead of the static values
+	if calibration_settings["useTunedSettings"] and not args.calibrate:
+		tuned_settings = calibration.read_tuned_settings(database, workspace_id, model_id)
+		if tuned_settings:
+			# Show which values of the settings file are replaced
+			logger.info(f'Using tuned settings from {tuned_settings["calibrated_at"]} instead of the `settings.json` values: threadCount {thread_count} -> {tuned_settings["thread_count"]}, uploadChunkSizeMb {upload_chunk_size_mb} -> {tuned_settings["chunk_size_mb"]}, compressUploadChunks {compress_upload_chunks} -> {tuned_settings["compress_upload_chunks"]}')
+			print(f'Using tuned settings from {tuned_settings["calibrated_at"]} instead of the `settings.json` values: threadCount {thread_count} -> {tuned_settings["thread_count"]}, uploadChunkSizeMb {upload_chunk_size_mb} -> {tuned_settings["chunk_size_mb"]}, compressUploadChunks {compress_upload_chunks} -> {tuned_settings["compress_upload_chunks"]}')
+			thread_count = tuned_settings["thread_count"]
+			upload_chunk_size_mb = tuned_settings["chunk_size_mb"]
+			compress_upload_chunks = tuned_settings["compress_upload_chunks"]
+
+	# Profile the chunking, compression and upload phases when requested
+	phase_profiler = profiler.PhaseProfiler(enabled=args.profile)
+
+	# Set up the pooled transport for the Integration API. HTTP/1.1 needs a connection per thread, HTTP/2 multiplexes
+	if http_transport_mode == "http2":
+		http_transport.configure(transport="http2", max_connections=http2_max_connections, timeouts=timeout_settings)
+	else:
+		http_transport.configure(transport=http_transport_mode, max_connections=thread_count, timeouts=timeout_settings)
+
+	# Write the chunks next to the file, into a scratch directory or into memory
+	store = chunk_store.create_store(chunk_store_settings)
+
+	# Compress each chunk on several cores, so compression does not depend on the number of chunks
+	parallel_gzip.configure(parallel_gzip_settings)
+
+	# Reuse the chunks of an earlier run with the same file and chunk settings
+	cache = chunk_cache.create_cache(chunk_cache_settings)
+
+	# The settings with the tuned thread count, chunk size and compression applied
+	upload_settings = {**settings, "threadCount": thread_count, "uploadChunkSizeMb": upload_chunk_size_mb, "compressUploadChunks": compress_upload_chunks}
+
+	# Validate, transform, diff, chunk and clean up the file the same way as job steps and the upload client
+	pipeline = upload_pipeline.UploadPipeline(args.file_to_upload, upload_settings, import_data_source=args.import_data_source, store=store, cache=cache) if args.file_to_upload else None
+
+	# Chunk the file and open the upload connections in the background while authenticating. Only for plain uploads
+	overlap_startup = overlap_startup and not (register or args.job or args.coordinator or args.worker or args.calibrate or args.export)
+
+	# Check the encoding and field counts of the file before anything is chunked or uploaded. When startup is
+	# overlapped, the file is validated in the background and no chunk is uploaded before validation has passed
+	if pipeline and not overlap_startup and not (register or args.job or args.worker or args.calibrate or args.export):
+		with phase_profiler.phase("validation"):
+			validation_errors = pipeline.validate()
+		if validation_errors:
+			logger.error('Upload not started because the file failed validation')
+			print('Upload not started because the file failed validation')
+			sys.exit(1)
+
+	if overlap_startup:
+		startup_scheduler = startup.StartupScheduler()
+		chunker = startup.BackgroundChunker(pipeline)
+		startup_scheduler.submit("validation", pipeline.validate)
+		startup_scheduler.submit("chunking", chunker.run)
+		startup_scheduler.submit("pre-warm", http_transport.prewarm, uri=integration_api_uri, connections=http2_max_connections if http_transport_mode == "http2" else thread_count)
 
 	# Based on authentication mode access Anaplan via the authentication API or OAuth API
 	if settings["authenticationMode"] == "OAuth":  # Use OAuth
@@ -100,16 +178,99 @@ def main():
 	# Set File to upload and import data source
 	file_to_upload = args.file_to_upload
 	import_data_source = args.import_data_source
+
+	# Run a job of dependent uploads, imports and processes and exit
+	if args.job:
+		job_succeeded = job_runner.run_job(job_file=args.job, settings=upload_settings, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id, hedge_settings=hedge_settings, profiler=phase_profiler)
+		phase_profiler.write_report()
+		sys.exit(0 if job_succeeded else 1)
+
+	# Coordinate a distributed upload of a single file across several hosts and exit
+	if args.coordinator:
+		worker_args = []
+		worker_environment = {}
+		if args.client_id:
+			worker_args += ['-c', args.client_id]
+		if args.user:
+			# The password is passed in the environment, command lines can be read by any user of the host
+			worker_args += ['-u', args.user]
+			worker_environment[utils.PASSWORD_VARIABLE] = args.password or ''
+		upload_succeeded = distributed.run_coordinator(file=file_to_upload, address=args.coordinator, chunk_size_mb=upload_chunk_size_mb, compress_upload_chunks=compress_upload_chunks, distributed_settings=distributed_settings, local_workers=args.local_workers, worker_args=worker_args, worker_environment=worker_environment, use_line_index=use_line_index, import_data_source=import_data_source, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id)
+		sys.exit(0 if upload_succeeded else 1)
+
+	# Upload the chunk ranges assigned by a coordinator and exit
+	if args.worker:
+		distributed.run_worker(address=args.worker, shared_secret=distributed_settings["sharedSecret"], max_workers=thread_count, file=file_to_upload, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id)
+		sys.exit(0)
+
+	# Run an export, download its chunks while converting them to columnar files and exit
+	if args.export:
+		try:
+			if export_settings["runExport"]:
+				anaplan_ops.run_action(action_type="exports", action_id=args.export, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id)
+		except RuntimeError:
+			print(f'Export {args.export} failed')
+			sys.exit(1)
+		with phase_profiler.phase("download"):
+			export_ops.download_export(file_id=args.export, output_path=os.path.join(export_settings["outputDirectory"], args.export), export_settings=export_settings, max_workers=thread_count, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id)
+		phase_profiler.write_report()
+		sys.exit(0)
+
+	# Calibrate the upload settings for this model and exit
+	if args.calibrate:
+		try:
+			calibration.calibrate(file=file_to_upload, database=database, calibration_settings=calibration_settings, transport=http_transport_mode, http2_max_connections=http2_max_connections, timeouts=timeout_settings, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id)
+		except anaplan_ops.UploadFailedError:
+			logger.error('Calibration stopped after a failed upload')
+			print('Calibration stopped after a failed upload')
+			sys.exit(1)
+		sys.exit(0)
 	
-	# Chunk files
-	chunk_files = file_ops.write_chunked_files(file=file_to_upload, chunk_size_mb=upload_chunk_size_mb, compress_upload_chunks=compress_upload_chunks)
+	# The failed, succeeded and skipped chunks of a failed upload are reported by the upload functions
+	upload_failed = False
 
-	# Upload files to Anaplan
-	anaplan_ops.upload_all_chunks(file_to_upload=file_to_upload, import_data_source=import_data_source, chunk_files=chunk_files, compress_upload_chunks=compress_upload_chunks, max_workers=thread_count, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id)  
+	# Temporary files are deleted even if the upload exits early, e.g. when the file ID cannot be resolved
+	try:
+		if overlap_startup:
+			# Resolve the file ID while the first chunks are written, then upload each chunk as soon as it is ready
+			startup_scheduler.submit("file ID", anaplan_ops.fetch_file_id, file_to_upload=file_to_upload, import_data_source=import_data_source, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id)
+			try:
+				if startup_scheduler.result("validation"):
+					logger.error('Upload not started because the file failed validation')
+					print('Upload not started because the file failed validation')
+					upload_failed = True
+				else:
+					with phase_profiler.phase("upload"):
+						try:
+							anaplan_ops.upload_chunk_stream(chunker, file_id=startup_scheduler.result("file ID"), file_to_upload=file_to_upload, import_data_source=import_data_source, compress_upload_chunks=compress_upload_chunks, max_workers=thread_count, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id, profiler=phase_profiler)
+						except anaplan_ops.UploadFailedError:
+							upload_failed = True
+			finally:
+				# Stop writing chunks after a failure and wait for the chunker, so every chunk written is deleted
+				chunker.stop()
+				startup_scheduler.result("chunking")
+			startup_scheduler.report()
+		else:
+			# Optionally project columns, filter rows and drop duplicates, and keep only the new or changed rows
+			pipeline.prepare(phase_profiler)
+
+			# Chunk files. Compression happens while the chunks are written
+			chunk_files = pipeline.write_chunks(phase_profiler)
 
-	# Delete temporary files
-	if delete_upload_chunks:
-		file_ops.delete_files(chunk_files)
+			# Upload files to Anaplan
+			with phase_profiler.phase("upload"):
+				try:
+					anaplan_ops.upload_all_chunks(file_to_upload=file_to_upload, import_data_source=import_data_source, chunk_files=chunk_files, compress_upload_chunks=compress_upload_chunks, max_workers=thread_count, verbose_endpoint_logging=verbose_endpoint_logging, retry_count=retry_count, base_uri=integration_api_uri, workspace_id=workspace_id, model_id=model_id, hedge_settings=hedge_settings, profiler=phase_profiler)
+				except anaplan_ops.UploadFailedError:
+					upload_failed = True
+
+		# Keep the row hashes of a differential load once its rows have been uploaded
+		if not upload_failed:
+			pipeline.finish()
+	finally:
+		# Delete temporary files. There is no pipeline without `-f`
+		if pipeline is not None:
+			pipeline.cleanup()
 
 	print('Process complete. Exiting...')
 	logger.info('Process complete. Exiting...')
@@ -119,8 +280,11 @@ def main():
 	logger.info(f"Total processing time: {processing_time:.2f} seconds.")  # Print the processing time
 	print(f"Total processing time: {processing_time:.2f} seconds.")  # Print the processing time
 
-	# Exit with return code 0
-	sys.exit(0)
+	# Write the profile report next to the log file
+	phase_profiler.write_report()
+
+	# Exit with return code 1 if any chunk failed, otherwise 0
+	sys.exit(1 if upload_failed else 0)
 
 
 if __name__ == '__main__':
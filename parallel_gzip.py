@@ -0,0 +1,149 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module to compress a single chunk with GZip on several cores, in the way of `pigz`
+# ===============================================================================
+
+import io
+import os
+import time
+import zlib
+import struct
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {"enabled": False, "threads": 0, "blockSizeKb": 1024, "compressionLevel": 9}
+
+# Deflate window, the dictionary carried from one block into the next
+WINDOW_SIZE = 32 * 1024
+
+# Set by `configure`, None compresses on the writing thread with `gzip.GzipFile`
+_executor = None
+_threads = 1
+_settings = dict(DEFAULT_SETTINGS)
+_configure_lock = threading.Lock()
+
+
+# === Configure parallel compression ===
+def configure(parallel_gzip_settings=None):
+    """
+    Sets up the thread pool shared by all chunks, from the `parallelGzip` block of `settings.json`:
+        - enabled (bool): Compress each chunk on several threads.
+        - threads (int): Number of compression threads. 0 uses one per CPU.
+        - blockSizeKb (int): Size of the blocks compressed independently.
+        - compressionLevel (int): GZip level from 1 (fastest) to 9 (smallest).
+
+    `zlib` releases the GIL while compressing, so threads scale with the cores.
+
+    Calling it again with the same settings keeps the pool. With other settings a new pool is created, but the
+    previous pool is not shut down: writers that are still open keep using it, and its threads end once the last
+    writer releases it.
+    """
+    global _executor, _threads, _settings
+    settings = {**DEFAULT_SETTINGS, **(parallel_gzip_settings or {})}
+    with _configure_lock:
+        if settings == _settings and (_executor is not None or not settings["enabled"]):
+            return
+
+        _settings = settings
+        _threads = _settings["threads"] or os.cpu_count()
+        if _settings["enabled"] and _threads > 1:
+            _executor = ThreadPoolExecutor(max_workers=_threads, thread_name_prefix="gzip")
+            logger.info(f'Parallel GZip compression on {_threads} threads with {_settings["blockSizeKb"]} KB blocks')
+        else:
+            _executor = None
+
+
+def is_enabled():
+    return _executor is not None
+
+
+# === GZip level of the chunks ===
+def compression_level():
+    """
+    Returns the level chunks are compressed with, `gzip.GzipFile` uses 9 unless parallel compression is enabled.
+    """
+    return _settings["compressionLevel"] if is_enabled() else 9
+
+
+# === Compress a block ===
+def compress_block(block, dictionary, level, last):
+    """
+    Compresses a block as raw deflate data primed with the end of the previous block, like `pigz`. Blocks other
+    than the last end with a sync flush, which aligns them to a byte boundary so they can be concatenated.
+    """
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+# === Parallel GZip stream ===
+class ParallelGzipWriter(io.BufferedIOBase):
+    """
+    A writable stream producing a single GZip member, like `gzip.GzipFile(fileobj=..., mode='wb')`. The input is
+    split into blocks compressed in parallel on the shared pool and written to `fileobj` in order. The CRC-32 and
+    size of the trailer are computed on the writing thread.
+
+    At most two blocks per thread are in flight, so memory is bounded by the block size and not by the chunk size.
+    Closing the stream writes the trailer but does not close `fileobj`.
+    """
+
+    def __init__(self, fileobj, level=None, block_size=None):
+        self.fileobj = fileobj
+        self.level = level or _settings["compressionLevel"]
+        self.block_size = block_size or _settings["blockSizeKb"] * 1024
+        self.executor = _executor
+        self.max_pending = 2 * _threads
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.dictionary = b''
+        self.crc = 0
+        self.size = 0
+
+        # GZip header: deflate, no file name, modification time, extra flags by level, unknown OS
+        extra_flags = 2 if self.level == 9 else 4 if self.level == 1 else 0
+        self.fileobj.write(b'\x1f\x8b\x08\x00' + struct.pack('<L', int(time.time())) + bytes([extra_flags, 255]))
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+        data = memoryview(data).cast('B')
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]), last=False)
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def _submit(self, block, last):
+        self.pending.append(self.executor.submit(compress_block, block, self.dictionary, self.level, last))
+        self.dictionary = block[-WINDOW_SIZE:]
+        while len(self.pending) > self.max_pending:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # The last block ends the deflate stream, even if it is empty
+            self._submit(bytes(self.buffer), last=True)
+            self.buffer = bytearray()
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().result())
+            self.fileobj.write(struct.pack('<LL', self.crc, self.size & 0xffffffff))
+            self.fileobj.flush()
+        finally:
+            super().close()
@@ -0,0 +1,152 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module for profiling the chunking, compression and upload phases of a run
+# ===============================================================================
+
+import io
+import time
+import logging
+import threading
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+import utils
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Phase profiler ===
+class PhaseProfiler:
+    """
+    Collects cProfile statistics and the tracemalloc peak for each named phase of a run, together with the
+    wall and CPU time of every worker thread. When disabled, every method is a no-op.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = {}   # phase name -> {"wall", "cpu", "peak_mb", "stats"}
+        self.threads = {}  # (phase name, thread name) -> {"calls", "wall", "cpu"}
+        self.lock = threading.Lock()
+
+    # === Profile a phase on the calling thread ===
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        profile = cProfile.Profile()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            _, peak = tracemalloc.get_traced_memory()
+
+            with self.lock:
+                entry = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "peak_mb": 0.0, "stats": None})
+                entry["wall"] += wall
+                entry["cpu"] += cpu
+                entry["peak_mb"] = max(entry["peak_mb"], peak / (1024 * 1024))
+                self._add_stats(entry, profile)
+
+            logger.info(f'Profiled phase `{name}`: {wall:.2f}s wall, {cpu:.2f}s CPU, {peak / (1024 * 1024):.1f} MB peak')
+
+    # === Wrap a function run by worker threads ===
+    def wrap_worker(self, phase_name, func):
+        """
+        Returns a wrapper around `func` that records the wall and CPU time of each call per thread and adds the
+        call's cProfile statistics to the phase.
+        """
+        if not self.enabled:
+            return func
+
+        def wrapper(*args, **kwargs):
+            profile = cProfile.Profile()
+            start_wall = time.perf_counter()
+            start_cpu = time.thread_time()
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                wall = time.perf_counter() - start_wall
+                cpu = time.thread_time() - start_cpu
+
+                with self.lock:
+                    thread = self.threads.setdefault((phase_name, threading.current_thread().name), {"calls": 0, "wall": 0.0, "cpu": 0.0})
+                    thread["calls"] += 1
+                    thread["wall"] += wall
+                    thread["cpu"] += cpu
+                    entry = self.phases.setdefault(phase_name, {"wall": 0.0, "cpu": 0.0, "peak_mb": 0.0, "stats": None})
+                    self._add_stats(entry, profile)
+
+        return wrapper
+
+    @staticmethod
+    def _add_stats(entry, profile):
+        if entry["stats"] is None:
+            entry["stats"] = pstats.Stats(profile)
+        else:
+            entry["stats"].add(profile)
+
+    # === Write the report ===
+    def write_report(self, path=None, top=25):
+        """
+        Writes the profiling report. By default the report is written next to the run log.
+
+        Returns:
+            str or None: The path of the report, or None when profiling is disabled.
+        """
+        if not self.enabled:
+            return None
+
+        if path is None:
+            path = f'{utils.log_file_path}{time.strftime("%Y%m%d-%H%M%S", time.localtime())}-ANAPLAN-PROFILE.LOG'
+
+        report = io.StringIO()
+        report.write("=== Phases ===\n")
+        report.write(f'{"Phase":<16}{"Wall (s)":>12}{"CPU (s)":>12}{"Peak (MB)":>12}\n')
+        for name, entry in self.phases.items():
+            report.write(f'{name:<16}{entry["wall"]:>12.2f}{entry["cpu"]:>12.2f}{entry["peak_mb"]:>12.1f}\n')
+
+        # CPU close to wall time means the thread was busy, otherwise it waited on the network or the GIL
+        report.write("\n=== Worker threads ===\n")
+        report.write(f'{"Phase":<16}{"Thread":<32}{"Calls":>8}{"Wall (s)":>12}{"CPU (s)":>12}{"CPU %":>8}\n')
+        total_wall = 0.0
+        total_cpu = 0.0
+        for (phase_name, thread_name), thread in sorted(self.threads.items()):
+            cpu_percent = 100 * thread["cpu"] / thread["wall"] if thread["wall"] else 0
+            report.write(f'{phase_name:<16}{thread_name:<32}{thread["calls"]:>8}{thread["wall"]:>12.2f}{thread["cpu"]:>12.2f}{cpu_percent:>8.1f}\n')
+            total_wall += thread["wall"]
+            total_cpu += thread["cpu"]
+        if total_wall:
+            report.write(f'\nWorker CPU share of wall time: {100 * total_cpu / total_wall:.1f}%. '
+                         f'A low share points at the network, a combined CPU time close to the phase wall time points at GIL contention.\n')
+
+        for name, entry in self.phases.items():
+            if entry["stats"] is None:
+                continue
+            report.write(f"\n=== cProfile: {name} (top {top} by cumulative time) ===\n")
+            entry["stats"].stream = report
+            entry["stats"].sort_stats("cumulative").print_stats(top)
+
+        with open(path, 'w', encoding='utf-8') as report_file:
+            report_file.write(report.getvalue())
+
+        logger.info(f"Profile report written to {path}")
+        print(f"Profile report written to {path}")
+        return path
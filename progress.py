@@ -0,0 +1,98 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module for the rate-limited, aggregated progress line shown while uploading chunks
+# ===============================================================================
+
+import sys
+import time
+import logging
+import threading
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Progress reporter ===
+class ProgressReporter:
+    """
+    Aggregates the progress of all upload threads into a single console line (MB/s, chunks done, ETA).
+
+    Threads only update counters. The line is redrawn at most once per `interval` seconds by whichever thread
+    gets there first, other threads never wait for the console.
+    """
+
+    def __init__(self, total_chunks, total_bytes, interval=0.5, stream=sys.stdout):
+        self.total_chunks = total_chunks
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.stream = stream
+        self.chunks_done = 0
+        self.bytes_done = 0
+        self.retries = 0
+        self.finished_chunks = set()  # Chunk numbers already counted, a hedged duplicate must not count twice
+        self.start_time = time.monotonic()
+        self.last_draw = 0.0
+        self.counter_lock = threading.Lock()
+        self.draw_lock = threading.Lock()
+
+    # === Record a finished chunk ===
+    def advance(self, chunk_bytes, chunk_num=None):
+        with self.counter_lock:
+            if chunk_num is not None:
+                if chunk_num in self.finished_chunks:
+                    return
+                self.finished_chunks.add(chunk_num)
+            self.chunks_done += 1
+            self.bytes_done += chunk_bytes
+        self._maybe_draw()
+
+    # === Add a chunk to the totals when the chunk count is not known up front ===
+    def add_total(self, chunk_bytes):
+        with self.counter_lock:
+            self.total_chunks += 1
+            self.total_bytes += chunk_bytes
+
+    # === Record a retry ===
+    def retry(self):
+        with self.counter_lock:
+            self.retries += 1
+        self._maybe_draw()
+
+    def _maybe_draw(self):
+        if time.monotonic() - self.last_draw < self.interval:
+            return
+        # Skip the redraw if another thread is already drawing
+        if not self.draw_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_draw = time.monotonic()
+            self.stream.write('\r' + self.status_line())
+            self.stream.flush()
+        finally:
+            self.draw_lock.release()
+
+    # === Build the status line ===
+    def status_line(self):
+        elapsed = max(time.monotonic() - self.start_time, 1e-6)
+        rate = self.bytes_done / elapsed
+        if rate > 0:
+            eta = f'{(self.total_bytes - self.bytes_done) / rate:.0f}s'
+        else:
+            eta = '--'
+        line = (f'Uploaded {self.chunks_done}/{self.total_chunks} chunks  '
+                f'{self.bytes_done / (1024 * 1024):.1f}/{self.total_bytes / (1024 * 1024):.1f} MB  '
+                f'{rate / (1024 * 1024):.2f} MB/s  ETA {eta}')
+        if self.retries:
+            line += f'  Retries {self.retries}'
+        return line
+
+    # === Draw the final line ===
+    def finish(self):
+        with self.draw_lock:
+            line = self.status_line()
+            self.stream.write('\r' + line + '\n')
+            self.stream.flush()
+        logger.info(line)
@@ -0,0 +1,204 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module for differential loads that upload only the rows added or changed since the last upload
+# ===============================================================================
+
+import os
+import sys
+import logging
+import apsw
+import file_ops
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Key of the second 64-bit hash. With the default key of pandas it makes a 128-bit hash, so two distinct keys or
+# rows are practically never taken for the same one
+SECOND_HASH_KEY = "anaplan-row-hash"
+
+
+# === Key of the row index of a data source ===
+def build_index_key(workspace_id, model_id, data_source):
+    """
+    Returns the key under which the row hashes of a data source are stored. Data sources of the same name in other
+    models have their own index.
+    """
+    return f'{workspace_id}/{model_id}/{data_source}'
+
+
+# === Open the row hash database ===
+def open_database(database):
+    connection = apsw.Connection(database)
+    connection.execute("pragma journal_mode=wal")
+    # Row keys and hashes are 128-bit hashes stored as two signed 64-bit integers. `pending_hashes` holds the hashes
+    # of the current run until its upload has succeeded
+    columns = [row[1] for row in connection.execute("pragma table_info(row_hashes)")]
+    if columns and "row_key2" not in columns:
+        # Hashes of an earlier version were 64-bit. Without them the next differential load uploads every row once
+        logger.warning(f"Replacing the 64-bit row hashes in {database}, the next differential load of each data source uploads all rows")
+        connection.execute("drop table row_hashes")
+        connection.execute("drop table if exists pending_hashes")
+    connection.execute("""create table if not exists row_hashes (
+                            data_source text, row_key integer, row_key2 integer, row_hash integer, row_hash2 integer,
+                            primary key (data_source, row_key, row_key2)) without rowid""")
+    connection.execute("""create table if not exists pending_hashes (
+                            data_source text, row_key integer, row_key2 integer, row_hash integer, row_hash2 integer,
+                            primary key (data_source, row_key, row_key2)) without rowid""")
+    return connection
+
+
+# === Hash the rows of a batch ===
+def hash_rows(batch, key_columns):
+    """
+    Hashes the key columns and the whole row of each row of a batch with two differently keyed runs of pandas'
+    vectorized 64-bit hashing, which make a 128-bit hash.
+
+    Returns:
+        tuple: The row keys and row hashes as lists of pairs of signed 64-bit integers, as SQLite stores them.
+    """
+    import pandas as pd
+
+    def hash_128(frame):
+        first = pd.util.hash_pandas_object(frame, index=False).to_numpy().view('int64')
+        second = pd.util.hash_pandas_object(frame, index=False, hash_key=SECOND_HASH_KEY).to_numpy().view('int64')
+        return list(zip(first.tolist(), second.tolist()))
+
+    return hash_128(batch[key_columns]), hash_128(batch)
+
+
+# === Check the key columns against the header ===
+def check_key_columns(file, key_columns, delimiter):
+    """
+    Exits if the key columns are empty or not in the header of the file. Without key columns every row would have
+    the same key, so all rows but one would be dropped from the differential load.
+    """
+    if not key_columns:
+        logger.error("Invalid `differentialLoad` settings, `keyColumns` is empty")
+        print("Please update the `differentialLoad` settings in the `settings.json` file with the `keyColumns` identifying a row")
+        sys.exit(1)
+
+    import pandas as pd
+    try:
+        header = pd.read_csv(file, sep=delimiter, dtype=str, nrows=0, encoding='utf-8').columns
+    except FileNotFoundError:
+        logger.error(f"File not found: {file}")
+        print(f"Error: The file {file} does not exist.")
+        sys.exit(1)
+
+    unknown_columns = [column for column in key_columns if column not in header]
+    if unknown_columns:
+        logger.error(f"Invalid `differentialLoad` settings, key columns not found in {file}: {unknown_columns}")
+        print(f"Invalid `differentialLoad` settings in the `settings.json` file, key columns not found in {file}: {unknown_columns}")
+        sys.exit(1)
+
+
+# === Write only the new and changed rows ===
+def diff_file(file, index_key, row_diff_settings):
+    """
+    Writes the rows of a file whose key is new or whose content changed since the last successful upload of the
+    data source, plus the header. Inserting a row near the top of the file only adds that row to the output,
+    unlike chunk-level comparisons where every later chunk boundary shifts.
+
+    Each batch of rows is hashed in pandas, loaded into a temporary table and joined with the stored hashes in
+    SQLite. Keys and rows are compared by their 128-bit hashes (see `hash_rows`), not by their values. The hashes of the changed rows are staged as pending and only replace the stored hashes once
+    `promote_hashes` is called after the upload succeeded, so the rows of a failed upload are sent again next time.
+
+    Rows removed from the file are not detected, because the import only adds and updates rows. The key columns
+    are expected to identify each row uniquely.
+
+    Args:
+        file (str): The path of the source file.
+        index_key (str): The key of the data source's row index. See `build_index_key`.
+        row_diff_settings (dict): The `differentialLoad` block from `settings.json`:
+            - keyColumns (list): The columns identifying a row, e.g. the list members and the time period.
+            - database (str): The SQLite database of the row hashes.
+            - batchRows (int): Number of rows per batch.
+            - delimiter (str): The field delimiter.
+
+    Returns:
+        str: The path of the file of new and changed rows, written next to the source file.
+    """
+    import pandas as pd
+    key_columns = row_diff_settings["keyColumns"]
+    batch_rows = row_diff_settings["batchRows"]
+    delimiter = row_diff_settings["delimiter"]
+    check_key_columns(file, key_columns, delimiter)
+
+    directory, file_base_name, file_extension = file_ops.split_source_name(file)
+    diff_output = os.path.join(directory, f"{file_base_name}_changed{file_extension}")
+
+    connection = open_database(row_diff_settings["database"])
+    connection.execute("""create temp table if not exists batch_rows (
+                            position integer primary key, row_key integer, row_key2 integer, row_hash integer, row_hash2 integer)""")
+
+    rows_read = 0
+    rows_written = 0
+    try:
+        # Hashes staged by an earlier run that failed are discarded
+        connection.execute("delete from pending_hashes where data_source=?", (index_key,))
+        stored_rows = connection.execute("select count(*) from row_hashes where data_source=?", (index_key,)).fetchall()[0][0]
+
+        batches = pd.read_csv(file, sep=delimiter, dtype=str, keep_default_na=False, na_filter=False,
+                              chunksize=batch_rows, encoding='utf-8')
+
+        with open(diff_output, 'w', encoding='utf-8', newline='') as output:
+            header_written = False
+
+            for batch in batches:
+                rows_read += len(batch)
+                row_keys, row_hashes = hash_rows(batch, key_columns)
+
+                with connection:
+                    connection.execute("delete from batch_rows")
+                    connection.executemany("insert into batch_rows values(?, ?, ?, ?, ?)",
+                                           ((position, *row_keys[position], *row_hashes[position]) for position in range(len(batch))))
+
+                    # Rows without a stored hash or with a different hash are new or changed
+                    changed = [position for position, in connection.execute(
+                        """select b.position from batch_rows b
+                           left join row_hashes r on r.data_source=? and r.row_key=b.row_key and r.row_key2=b.row_key2
+                           where r.row_hash is null or r.row_hash != b.row_hash or r.row_hash2 != b.row_hash2
+                           order by b.position""", (index_key,))]
+
+                    # Only the changed rows need new hashes, the other rows already match the stored ones
+                    connection.executemany("insert or replace into pending_hashes values(?, ?, ?, ?, ?)",
+                                           ((index_key, *row_keys[position], *row_hashes[position]) for position in changed))
+
+                # Always write the header, even if no row changed
+                batch = batch.iloc[changed]
+                if len(batch) or not header_written:
+                    batch.to_csv(output, sep=delimiter, index=False, header=not header_written, lineterminator='\n')
+                    header_written = True
+                rows_written += len(batch)
+
+    except FileNotFoundError:
+        logger.error(f"File not found: {file}")
+        print(f"Error: The file {file} does not exist.")
+        sys.exit(1)
+    finally:
+        connection.close()
+
+    logger.info(f"Differential load of {index_key}: rows read: {rows_read}, new or changed: {rows_written}, rows in index: {stored_rows}")
+    print(f"Differential load: rows read: {rows_read}, new or changed: {rows_written}")
+
+    return diff_output
+
+
+# === Keep the hashes of an uploaded file ===
+def promote_hashes(index_key, row_diff_settings):
+    """
+    Replaces the stored row hashes of a data source with the hashes staged by `diff_file`. Call it once the upload
+    of the changed rows has succeeded.
+    """
+    connection = open_database(row_diff_settings["database"])
+    try:
+        with connection:
+            connection.execute("""insert or replace into row_hashes select data_source, row_key, row_key2, row_hash, row_hash2
+                                  from pending_hashes where data_source=?""", (index_key,))
+            connection.execute("delete from pending_hashes where data_source=?", (index_key,))
+    finally:
+        connection.close()
+    logger.info(f"Row hashes of {index_key} updated")
@@ -0,0 +1,102 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module to overlap authentication, file ID resolution and connection pre-warming with chunking
+# ===============================================================================
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Startup scheduler ===
+class StartupScheduler:
+    """
+    Runs independent startup tasks on background threads and records when each one started and finished, so the
+    overlap between network-bound tasks (authentication, metadata lookups) and chunking can be checked in the log.
+
+    The threads are daemon threads, so an authentication failure that exits the program does not wait for chunking.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.futures = {}   # task name -> Future
+        self.timings = {}   # task name -> (start, end) in seconds from the scheduler start
+
+    # === Start a task ===
+    def submit(self, name, func, *args, **kwargs):
+        future = Future()
+
+        def run():
+            start = time.perf_counter() - self.start_time
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as err:
+                future.set_exception(err)
+            finally:
+                self.timings[name] = (start, time.perf_counter() - self.start_time)
+
+        self.futures[name] = future
+        threading.Thread(target=run, name=name, daemon=True).start()
+        return future
+
+    # === Wait for a task ===
+    def result(self, name):
+        return self.futures[name].result()
+
+    # === Log when each task ran ===
+    def report(self):
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            logger.info(f'Startup task `{name}` ran from {start:.2f}s to {end:.2f}s')
+
+
+# === Chunk on a background thread ===
+class BackgroundChunker:
+    """
+    Runs the transform, differential load and chunking steps of an `upload_pipeline.UploadPipeline` on a background
+    thread and hands out each chunk as soon as it is written. Iterating the chunker blocks until the next chunk is
+    ready and re-raises any error of the chunker.
+
+    Call `stop` when the upload fails, so no more chunks are written, and wait for the `chunking` task before the
+    chunks in `pipeline.chunk_files` are deleted.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.queue = queue.SimpleQueue()
+        self.stop_event = threading.Event()
+        self.error = None
+
+    # === Stop after the chunk being written ===
+    def stop(self):
+        self.stop_event.set()
+
+    # === Produce the chunks, run as a startup task ===
+    def run(self):
+        try:
+            self.pipeline.prepare()
+            if not self.stop_event.is_set():
+                for chunk_file in self.pipeline.iter_chunks():
+                    self.queue.put(chunk_file)
+                    if self.stop_event.is_set():
+                        logger.info(f'Chunking stopped after {len(self.pipeline.chunk_files)} chunks')
+                        break
+        except BaseException as err:
+            # The chunker exits on errors such as a missing file, which is re-raised in the consuming thread
+            self.error = err
+        finally:
+            self.queue.put(None)
+        return len(self.pipeline.chunk_files)
+
+    def __iter__(self):
+        while (chunk_file := self.queue.get()) is not None:
+            yield chunk_file
+        if self.error is not None:
+            raise self.error
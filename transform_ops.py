@@ -0,0 +1,203 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module for the optional pre-upload transform stage (column projection, row filters and dedup)
+# ===============================================================================
+
+import os
+import sys
+import logging
+import apsw
+import file_ops
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+# Key of the second 64-bit row hash. With the default key of pandas it makes a 128-bit hash, so two distinct rows
+# are practically never taken for duplicates
+SECOND_HASH_KEY = "anaplan-row-hash"
+
+
+# === Build a vectorized row mask for a single filter ===
+def build_filter_mask(df, row_filter):
+    """
+    Evaluates a filter against a batch of rows.
+
+    Args:
+        df (pandas.DataFrame): A batch of rows read as strings.
+        row_filter (dict): A filter with the keys `column`, `op` and `value`.
+            Supported operators are `==`, `!=`, `in`, `not in`, `contains`, `not empty`, `>`, `>=`, `<` and `<=`.
+            The comparison operators convert the column to numbers, rows that cannot be converted are dropped.
+
+    Returns:
+        pandas.Series: A boolean mask of the rows to keep.
+    """
+    column = df[row_filter["column"]]
+    value = row_filter.get("value")
+
+    match row_filter["op"]:
+        case "==":
+            return column == str(value)
+        case "!=":
+            return column != str(value)
+        case "in":
+            return column.isin([str(v) for v in value])
+        case "not in":
+            return ~column.isin([str(v) for v in value])
+        case "contains":
+            return column.str.contains(str(value), regex=False)
+        case "not empty":
+            return column != ""
+        case ">" | ">=" | "<" | "<=":
+            import pandas as pd
+            numbers = pd.to_numeric(column, errors="coerce")
+            match row_filter["op"]:
+                case ">":
+                    return numbers > value
+                case ">=":
+                    return numbers >= value
+                case "<":
+                    return numbers < value
+                case "<=":
+                    return numbers <= value
+        case _:
+            raise ValueError(f'Unsupported filter operator `{row_filter["op"]}`')
+
+
+# === Open the set of rows already written ===
+def open_seen_rows():
+    # An empty file name opens a private temporary database, deleted when it is closed
+    connection = apsw.Connection("")
+    connection.execute("create table seen_rows (row_hash integer, row_hash2 integer, primary key (row_hash, row_hash2)) without rowid")
+    connection.execute("create table batch_rows (position integer primary key, row_hash integer, row_hash2 integer)")
+    return connection
+
+
+# === Hash the rows of a batch ===
+def hash_rows(batch):
+    """
+    Hashes each row of a batch with two differently keyed runs of pandas' vectorized 64-bit hashing.
+
+    Returns:
+        pandas.DataFrame: The two halves of the 128-bit hash of each row as signed 64-bit integers, as SQLite stores them.
+    """
+    import pandas as pd
+    return pd.DataFrame({"row_hash": pd.util.hash_pandas_object(batch, index=False).to_numpy().view('int64'),
+                         "row_hash2": pd.util.hash_pandas_object(batch, index=False, hash_key=SECOND_HASH_KEY).to_numpy().view('int64')})
+
+
+# === Drop the rows of a batch already written ===
+def drop_seen_rows(connection, positions, row_hashes):
+    """
+    Returns the positions whose row hash has not been seen before, and records their hashes as seen. Rows are
+    compared by their 128-bit hash only, see `hash_rows`.
+
+    Args:
+        connection (apsw.Connection): The set of rows already written. See `open_seen_rows`.
+        positions (list): The positions in the batch of the rows to check, without duplicates within the batch.
+        row_hashes (pandas.DataFrame): The row hashes of the batch. See `hash_rows`.
+    """
+    with connection:
+        connection.execute("delete from batch_rows")
+        hashes = row_hashes.to_numpy().tolist()
+        connection.executemany("insert into batch_rows values(?, ?, ?)", ((position, *hashes[position]) for position in positions))
+        new_positions = [position for position, in connection.execute(
+            """select b.position from batch_rows b
+               where not exists (select 1 from seen_rows s where s.row_hash=b.row_hash and s.row_hash2=b.row_hash2)
+               order by b.position""")]
+        connection.execute("insert or ignore into seen_rows select row_hash, row_hash2 from batch_rows")
+    return new_positions
+
+
+# === Transform a file before chunking ===
+def transform_file(file, transform_settings):
+    """
+    Streams a delimited file through column projection, row filters and de-duplication in vectorized batches.
+
+    The header is written once and all values are kept as strings so the output matches the source formatting.
+
+    Duplicates are found by comparing 128-bit row hashes, not the rows themselves. The hashes of the rows already
+    written are kept in a temporary SQLite database, which spills to disk once it outgrows its page cache, so
+    de-duplicating a file with many distinct rows does not hold them all in memory.
+
+    Args:
+        file (str): The path of the source file.
+        transform_settings (dict): The `transform` block from `settings.json`:
+            - columns (list): Columns to keep, in source order. Empty keeps all columns.
+            - filters (list): Filters applied in sequence. See `build_filter_mask`.
+            - dropDuplicates (bool): Drop rows identical to an earlier row of the file.
+            - batchRows (int): Number of rows per batch.
+            - delimiter (str): The field delimiter.
+
+    Returns:
+        str: The path of the transformed file, written next to the source file.
+    """
+    import pandas as pd
+    columns = transform_settings["columns"] or None
+    filters = transform_settings["filters"]
+    drop_duplicates = transform_settings["dropDuplicates"]
+    batch_rows = transform_settings["batchRows"]
+    delimiter = transform_settings["delimiter"]
+
+    # Split the file path into directory, file name, and extension. Compressed sources are decompressed by pandas
+    directory, file_base_name, file_extension = file_ops.split_source_name(file)
+    transformed_file = os.path.join(directory, f"{file_base_name}_transformed{file_extension}")
+
+    # Filter columns are read even when they are not kept in the output
+    filter_columns = [f["column"] for f in filters]
+    read_columns = None if columns is None else list(dict.fromkeys(columns + filter_columns))
+
+    rows_read = 0
+    rows_written = 0
+    seen_rows = open_seen_rows() if drop_duplicates else None
+
+    try:
+        batches = pd.read_csv(file, sep=delimiter, usecols=read_columns, dtype=str, keep_default_na=False,
+                              na_filter=False, chunksize=batch_rows, encoding='utf-8')
+
+        with open(transformed_file, 'w', encoding='utf-8', newline='') as output:
+            header_written = False
+
+            for batch in batches:
+                rows_read += len(batch)
+
+                # Apply the row filters
+                for row_filter in filters:
+                    batch = batch[build_filter_mask(batch, row_filter)]
+
+                # Project the columns in the order requested
+                if columns is not None:
+                    batch = batch[columns]
+
+                # Drop duplicates within the batch and against earlier batches
+                if drop_duplicates and len(batch):
+                    row_hashes = hash_rows(batch)
+                    first_positions = (~row_hashes.duplicated()).to_numpy().nonzero()[0].tolist()
+                    batch = batch.iloc[drop_seen_rows(seen_rows, first_positions, row_hashes)]
+
+                # Always write the header, even if every row is filtered out
+                if len(batch) or not header_written:
+                    batch.to_csv(output, sep=delimiter, index=False, header=not header_written, lineterminator='\n')
+                    header_written = True
+                rows_written += len(batch)
+
+    except FileNotFoundError:
+        logger.error(f"File not found: {file}")
+        print(f"Error: The file {file} does not exist.")
+        sys.exit(1)
+    except (KeyError, ValueError) as err:
+        logger.error(f"Invalid `transform` settings: {err}")
+        print(f"Invalid `transform` settings in the `settings.json` file: {err}")
+        sys.exit(1)
+    finally:
+        if seen_rows is not None:
+            seen_rows.close()
+
+    source_size = os.path.getsize(file)
+    transformed_size = os.path.getsize(transformed_file)
+    logger.info(f"Transform complete. Rows read: {rows_read}, rows written: {rows_written}, bytes: {source_size} -> {transformed_size}")
+    print(f"Transform complete. Rows read: {rows_read}, rows written: {rows_written}, bytes: {source_size} -> {transformed_size}")
+
+    return transformed_file
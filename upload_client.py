@@ -0,0 +1,216 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Reusable library API for uploading files to Anaplan from a long-lived process
+# ===============================================================================
+
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import globals
+import utils
+import anaplan_auth_api
+import anaplan_oauth
+import anaplan_ops
+import http_transport
+import chunk_store
+import chunk_cache
+import upload_pipeline
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    """
+    Raised when an upload or the authentication of an `UploadClient` fails.
+    """
+
+
+# === Upload client ===
+class UploadClient:
+    """
+    Uploads files to Anaplan without going through `main.py`.
+
+    Each client owns its token state, background token refresh, HTTP connection pool, upload thread pool and chunk
+    store, so it can be created once and reused for many uploads in the same process. Several clients can coexist.
+
+    Parallel compression of the chunks uses a pool shared by the whole process, which the client does not set up.
+    Call `parallel_gzip.configure` once at startup to enable it.
+
+    Example:
+        with UploadClient() as client:
+            client.upload("./sales.csv", data_source="Sales.csv")
+    """
+
+    def __init__(self, settings=None, username=None, password=None):
+        """
+        OAuth uses the Client ID and refresh token stored in the token database by `main.py -r -c <<Client ID>>`.
+
+        Args:
+            settings (dict, optional): The configuration settings. Defaults to the `settings.json` file.
+            username (str, optional): Username for basic authentication.
+            password (str, optional): Password for basic authentication.
+        """
+        self.settings = settings if settings is not None else utils.read_configuration_settings()
+        self.username = username
+        self.password = password
+
+        # Token state owned by this client instead of the shared `globals.Auth`
+        self.auth = globals.Auth(client_id=None, device_code=None, access_token=None)
+
+        # HTTP/1.1 needs a connection per thread, HTTP/2 multiplexes the uploads over a few connections
+        transport = self.settings["httpTransport"]
+        max_connections = self.settings["http2MaxConnections"] if transport == "http2" else self.settings["threadCount"]
+        self.http_client = http_transport.create_client(transport=transport, max_connections=max_connections, timeouts=self.settings["timeouts"])
+        self.executor = ThreadPoolExecutor(max_workers=self.settings["threadCount"], thread_name_prefix="upload")
+        self.store = chunk_store.create_store(self.settings["chunkStore"])
+        self.cache = chunk_cache.create_cache(self.settings["chunkCache"])
+
+        self.stop_event = threading.Event()
+        self.refresh_thread = None
+        self.refresh_error = None
+        self.auth_lock = threading.Lock()
+
+    # === Authenticate and start the token refresh ===
+    def authenticate(self):
+        """
+        Authenticates with the mode set in the settings and starts refreshing the token in the background.
+        Called automatically by each upload, it only authenticates again if the background refresh failed.
+
+        Raises:
+            UploadError: If the authentication fails, or the background refresh failed since the last upload.
+        """
+        with self.auth_lock:
+            if self.refresh_error is not None:
+                # Report the failed refresh once, the next upload authenticates again
+                self.refresh_error, self.refresh_thread = None, None
+                raise UploadError("The background token refresh failed. See the log file for details")
+            if self.refresh_thread is not None:
+                return
+
+            settings = self.settings
+            try:
+                match settings["authenticationMode"]:
+                    case "OAuth":
+                        oauth_uri = f'{settings["uris"]["oauthService"]}/token'
+                        anaplan_oauth.refresh_tokens(uri=oauth_uri, database=settings["database"], delay=0,
+                                                     rotatable_token=settings["rotatableToken"], auth=self.auth)
+                        self.refresh_thread = self.create_refresh_thread(
+                            anaplan_oauth.refresh_tokens, delay=settings["accessTokenTtl"], uri=oauth_uri, database=settings["database"],
+                            rotatable_token=settings["rotatableToken"])
+                    case "basic" | "cert_auth":
+                        authentication_uri = settings["uris"]["authenticationApi"]
+                        if settings["authenticationMode"] == "basic":
+                            anaplan_auth_api.basic_authentication(uri=f'{authentication_uri}/authenticate', username=self.username,
+                                                                  password=self.password, auth=self.auth)
+                        else:
+                            anaplan_auth_api.cert_authentication(uri=f'{authentication_uri}/authenticate', public_cert_path=settings["publicCertPath"],
+                                                                 private_key_path=settings["privateKeyPath"], auth=self.auth)
+                        self.refresh_thread = self.create_refresh_thread(
+                            anaplan_auth_api.refresh_tokens, delay=settings["accessTokenTtl"], uri=f'{authentication_uri}/refresh')
+                    case _:
+                        raise UploadError("Please update the settings with an authentication mode of `basic`, `cert_auth`, or `OAuth`")
+            except SystemExit:
+                # The authentication modules exit on failure, which must not end the caller's process
+                raise UploadError("Authentication with Anaplan failed. See the log file for details")
+
+            self.refresh_thread.start()
+
+    # === Background token refresh ===
+    def create_refresh_thread(self, refresh_tokens, **kwargs):
+        """
+        Returns a daemon thread running the `refresh_tokens` loop of an authentication module with this client's token
+        state. The loop exits its thread on failure, so the error is kept and raised by the next upload instead of
+        every later request failing with an expired token.
+        """
+        def run():
+            try:
+                refresh_tokens(auth=self.auth, stop_event=self.stop_event, **kwargs)
+            except (Exception, SystemExit) as err:
+                logger.error(f'Background token refresh failed: {err!r}')
+                self.refresh_error = err
+
+        return threading.Thread(target=run, name="Refresh Token", daemon=True)
+
+    # === Upload a file ===
+    def upload(self, file, data_source=None):
+        """
+        Chunks a file and uploads it to an import data source, reusing the client's token, connections and threads.
+
+        Args:
+            file (str): The path of the file to upload.
+            data_source (str, optional): The name of the import data source. Defaults to the file name.
+
+        Returns:
+            dict: The file ID, the number of chunks and the elapsed time in seconds.
+
+        Raises:
+            UploadError: If the upload fails.
+        """
+        self.authenticate()
+
+        settings = self.settings
+        start_time = time.perf_counter()
+        pipeline = upload_pipeline.UploadPipeline(file, settings, import_data_source=data_source, store=self.store, cache=self.cache)
+
+        try:
+            # Check the encoding and field counts before anything is uploaded
+            validation_errors = pipeline.validate()
+            if validation_errors:
+                raise UploadError(f"{file} failed validation with {len(validation_errors)} errors, first on line {validation_errors[0][0]}")
+
+            pipeline.prepare()
+            chunk_files = pipeline.write_chunks()
+
+            file_id = anaplan_ops.upload_all_chunks(
+                file_to_upload=file, import_data_source=data_source, chunk_files=chunk_files,
+                compress_upload_chunks=settings["compressUploadChunks"], max_workers=settings["threadCount"],
+                verbose_endpoint_logging=settings["verboseEndpointLogging"], retry_count=settings["retryCount"],
+                base_uri=settings["uris"]["integrationApi"], workspace_id=settings["workspaceId"], model_id=settings["modelId"],
+                hedge_settings=settings["hedgeUploads"], auth=self.auth, client=self.http_client, executor=self.executor)
+
+            pipeline.finish()
+
+        except anaplan_ops.UploadFailedError as err:
+            raise UploadError(f"Upload of {file} failed: {err}") from err
+
+        except SystemExit:
+            # The upload functions exit on unrecoverable errors, which must not end the caller's process
+            raise UploadError(f"Upload of {file} failed. See the log file for details")
+
+        finally:
+            pipeline.cleanup()
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(f'Uploaded {file} as file ID {file_id} in {elapsed:.2f} seconds')
+        return {"file_id": file_id, "chunk_count": len(chunk_files), "seconds": elapsed}
+
+    # === Upload a file from asyncio code ===
+    async def upload_async(self, file, data_source=None):
+        """
+        Awaitable version of `upload`. The upload runs on a worker thread so the event loop is not blocked.
+        """
+        return await asyncio.to_thread(self.upload, file, data_source)
+
+    # === Release the client's resources ===
+    def close(self):
+        self.stop_event.set()
+        self.executor.shutdown()
+        self.http_client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,148 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module for the steps between a source file and its uploaded chunks, shared by every entry point
+# ===============================================================================
+
+import os
+import contextlib
+import logging
+import anaplan_ops
+import file_ops
+import transform_ops
+import validation
+import row_diff
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Upload pipeline of a file ===
+class UploadPipeline:
+    """
+    Runs the steps of uploading one file in the order used by `main.py`, `startup.BackgroundChunker`, the upload
+    steps of `job_runner` and `upload_client.UploadClient`:
+
+        validate -> transform -> differential load -> chunk -> (upload) -> promote row hashes -> delete temporary files
+
+    The upload itself is left to the caller, which calls `finish` once the upload succeeded and `cleanup` whether it
+    succeeded or not.
+
+    Args:
+        file (str): The path of the file to upload.
+        settings (dict): The configuration settings, with any tuned chunk size and compression applied.
+        import_data_source (str, optional): The name of the import data source. Defaults to the file name.
+        store (chunk_store.DiskChunkStore, optional): Where the chunks are written.
+        cache (chunk_cache.ChunkCache, optional): Reuse or keep the chunks of the source file.
+    """
+
+    def __init__(self, file, settings, import_data_source=None, store=None, cache=None):
+        self.file = file
+        self.settings = settings
+        self.store = store
+        self.cache = cache
+        self.file_to_chunk = file
+        self.chunk_files = []
+
+        # The row hashes of a differential load are kept per workspace, model and data source
+        self.index_key = None
+        if settings["differentialLoad"]["enabled"]:
+            self.index_key = row_diff.build_index_key(settings["workspaceId"], settings["modelId"],
+                                                      anaplan_ops.get_data_source_name(file_to_upload=file, import_data_source=import_data_source))
+
+    # === Check the file ===
+    def validate(self):
+        """
+        Returns the validation errors of the file, see `validation.validate_file`. Empty if the file is valid or
+        validation is disabled.
+        """
+        if not self.settings["validation"]["enabled"]:
+            return []
+        return validation.validate_file(file=self.file, validation_settings=self.settings["validation"],
+                                        use_line_index=self.settings["useLineIndex"])
+
+    # === Transform and diff the file ===
+    def prepare(self, phase_profiler=None):
+        """
+        Optionally projects columns, filters rows and drops duplicates, then optionally keeps only the rows that are
+        new or changed since the last upload. The intermediate transformed file of a differential load is deleted.
+
+        Args:
+            phase_profiler (profiler.PhaseProfiler, optional): Profiles the transform and differential load phases.
+                Only pass it from the main thread, as only one phase can be profiled at a time.
+
+        Returns:
+            str: The path of the file to chunk.
+        """
+        transform_settings = self.settings["transform"]
+        row_diff_settings = self.settings["differentialLoad"]
+
+        if transform_settings["enabled"]:
+            with self.phase(phase_profiler, "transform"):
+                self.file_to_chunk = transform_ops.transform_file(file=self.file, transform_settings=transform_settings)
+
+        if row_diff_settings["enabled"]:
+            transformed_file = self.file_to_chunk
+            with self.phase(phase_profiler, "differential load"):
+                self.file_to_chunk = row_diff.diff_file(file=transformed_file, index_key=self.index_key, row_diff_settings=row_diff_settings)
+            if transformed_file != self.file:
+                file_ops.delete_files([transformed_file])
+
+        return self.file_to_chunk
+
+    # === Chunk the file ===
+    def iter_chunks(self):
+        """
+        Yields the chunks of the prepared file as soon as each one is written, and records them for `cleanup`.
+        """
+        # Only chunks of the source itself are cached, a transformed or differential file is new on every run
+        cache = self.cache if self.file_to_chunk == self.file else None
+        for chunk_file in file_ops.iter_chunked_files(file=self.file_to_chunk, chunk_size_mb=self.settings["uploadChunkSizeMb"],
+                                                      compress_upload_chunks=self.settings["compressUploadChunks"],
+                                                      passthrough_compressed_source=self.settings["passthroughCompressedSource"],
+                                                      use_line_index=self.settings["useLineIndex"], store=self.store, cache=cache):
+            self.chunk_files.append(chunk_file)
+            yield chunk_file
+
+    def write_chunks(self, phase_profiler=None):
+        """
+        Chunks the prepared file. See `iter_chunks`.
+
+        Returns:
+            list: The chunk file paths, or memory chunks of a `chunk_store.MemoryChunkStore`.
+        """
+        with self.phase(phase_profiler, "chunking"):
+            return list(self.iter_chunks())
+
+    # === After a successful upload ===
+    def finish(self):
+        """
+        Keeps the row hashes of a differential load once its rows have been uploaded.
+        """
+        if self.settings["differentialLoad"]["enabled"]:
+            row_diff.promote_hashes(index_key=self.index_key, row_diff_settings=self.settings["differentialLoad"])
+
+    # === Delete temporary files ===
+    def cleanup(self):
+        """
+        Deletes the chunks and the transformed or differential file if `deleteUploadChunks` is set, whether the
+        upload succeeded or not. Cached chunks are kept by `file_ops.delete_files`, and the emptied temporary folder of
+        newly cached chunks is removed.
+        """
+        if not self.settings["deleteUploadChunks"]:
+            return
+
+        # A passed-through gzip source is its own chunk and must be kept
+        file_ops.delete_files([chunk_file for chunk_file in self.chunk_files if chunk_file != self.file_to_chunk])
+        if self.cache is not None:
+            self.cache.remove_run_directories(self.chunk_files)
+
+        # The transformed file is only needed to produce the chunks
+        if self.file_to_chunk != self.file and os.path.isfile(self.file_to_chunk):
+            file_ops.delete_files([self.file_to_chunk])
+
+    @staticmethod
+    def phase(phase_profiler, name):
+        return phase_profiler.phase(name) if phase_profiler else contextlib.nullcontext()
@@ -12,6 +12,12 @@ import logging
 import time
 import argparse
 import json
+import atexit
+import queue
+import logging.handlers
+
+# Environment variable read when `-p` is not passed, so the password does not show in the process list
+PASSWORD_VARIABLE = "ANAPLAN_PASSWORD"
 
 # === Clear Console ===
 def clear_console():
@@ -27,10 +33,16 @@ log_file_path = "./"
 local_time = time.strftime("%Y%m%d", time.localtime())
 log_file = f'{log_file_path}{local_time}-ANAPLAN-RUN.LOG'
 log_file_level = logging.INFO  # Options: INFO, WARNING, DEBUG, INFO, ERROR, CRITICAL
-logging.basicConfig(filename=log_file,
-                    filemode='a',  # Append to Log
-                    format='%(asctime)s  :  %(levelname)s  :  %(message)s',
+
+# Log records are put on a queue and written by a single listener thread, so upload threads never wait on the file
+log_queue = queue.SimpleQueue()
+log_file_handler = logging.FileHandler(log_file, mode='a')  # Append to Log
+log_file_handler.setFormatter(logging.Formatter('%(asctime)s  :  %(levelname)s  :  %(message)s'))
+log_listener = logging.handlers.QueueListener(log_queue, log_file_handler)
+logging.basicConfig(handlers=[logging.handlers.QueueHandler(log_queue)],
                     level=log_file_level)
+log_listener.start()
+atexit.register(log_listener.stop)  # Flush the queue on exit
 logging.info("************** Logger Started ****************")
 
 
@@ -73,11 +85,25 @@ def read_cli_arguments():
     parser.add_argument('-u', '--user', action='store',
                         type=str, help='Username for basic authentication')
     parser.add_argument('-p', '--password', action='store',
-                        type=str, help='Password for basic authentication')
+                        type=str, help=f'Password for basic authentication. Defaults to the `{PASSWORD_VARIABLE}` environment variable')
     parser.add_argument('-f', '--file_to_upload', action='store',
                         type=str, help="File to upload to Anaplan")
     parser.add_argument('-i', '--import_data_source', action='store',
                         type=str, help="Import data source. Optional. Default is `none`.")
+    parser.add_argument('-j', '--job', action='store',
+                        type=str, help="Job file of dependent uploads, imports and processes to run")
+    parser.add_argument('--coordinator', action='store', metavar='HOST:PORT',
+                        type=str, help="Coordinate a distributed upload of the file, listening on HOST:PORT")
+    parser.add_argument('--worker', action='store', metavar='HOST:PORT',
+                        type=str, help="Upload chunk ranges assigned by the coordinator at HOST:PORT")
+    parser.add_argument('--local_workers', action='store', default=0,
+                        type=int, help="Number of worker processes the coordinator starts on this host. Default is 0.")
+    parser.add_argument('--calibrate', action='store_true',
+                        help="Upload a sample of the file with different settings and store the fastest configuration for the model")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile the chunking, compression and upload phases and write a report next to the log file")
+    parser.add_argument('-e', '--export', action='store', metavar='EXPORT_ID',
+                        type=str, help="Run an export and convert the downloaded file to Parquet or NumPy columns")
 
     
     # Check if no arguments were passed (only the script name is present)
@@ -86,4 +112,6 @@ def read_cli_arguments():
         sys.exit(1)  # Exit the script
 
     args = parser.parse_args()
+    if args.password is None:
+        args.password = os.environ.get(PASSWORD_VARIABLE)
     return args
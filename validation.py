@@ -0,0 +1,221 @@
+# ===============================================================================
+# Created:        19 Oct 2026
+# Updated:
+# @author:        Quinlan Eddy
+# Description:    Module for the optional pre-flight validation of a file before any chunk is uploaded
+# ===============================================================================
+
+import io
+import os
+import csv
+import time
+import itertools
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import file_ops
+
+
+# Enable logger
+logger = logging.getLogger(__name__)
+
+
+# === Validate a block of whole lines ===
+def validate_block(data, delimiter, quote_char, expected_fields, skip_header, max_errors):
+    """
+    Validates a block of whole lines: UTF-8 encoding and the number of fields of each record.
+
+    Fields are counted by counting delimiters. Lines that contain the quote character are always parsed with the
+    `csv` module, whatever their count, so quoted delimiters are not miscounted. If a quoted field spans lines, the
+    whole block is parsed with `validate_records`.
+
+    Args:
+        data (bytes): The block, starting at the beginning of a line and ending after a line break (or end of file).
+        delimiter (str): The field delimiter.
+        quote_char (str): The quote character.
+        expected_fields (int): The number of fields of the header.
+        skip_header (bool): The block starts with the header line, which is not checked.
+        max_errors (int): Stop after this many errors.
+
+    Returns:
+        tuple: The number of lines in the block and a list of `(line number in the block, message)`.
+    """
+    line_count = data.count(b'\n') + (0 if data.endswith(b'\n') or not data else 1)
+    errors = []
+
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError as err:
+        errors.append((data.count(b'\n', 0, err.start) + 1, f'Invalid UTF-8 byte 0x{data[err.start]:02x}'))
+        text = data.decode('utf-8', errors='replace')
+
+    first_line = 2 if skip_header else 1
+    encoding_errors = list(errors)
+
+    # Count the delimiters of every line in C and only look closer at the lines with an unexpected count or quotes,
+    # as a quoted delimiter can make a line with too few fields look complete
+    lines = data.split(b'\n')[first_line - 1:]
+    counts = map(bytes.count, lines, itertools.repeat(delimiter.encode('utf-8')))
+    quote = quote_char.encode('utf-8')
+    for index, count in enumerate(counts):
+        line = lines[index]
+        if count == expected_fields - 1 and quote not in line:
+            continue
+        # Blank lines, including the one after the final line break, are ignored
+        if line in (b'', b'\r'):
+            continue
+        fields = count + 1
+        if quote in line:
+            # Quoted delimiters are not field separators. An unterminated quote means a record spans several lines
+            try:
+                fields = len(next(csv.reader([line.rstrip(b'\r').decode('utf-8', errors='replace')],
+                                             delimiter=delimiter, quotechar=quote_char, strict=True)))
+            except csv.Error:
+                return line_count, (encoding_errors + validate_records(text, delimiter, quote_char, expected_fields, first_line, max_errors))[:max_errors]
+            if fields == expected_fields:
+                continue
+        errors.append((first_line + index, f'Expected {expected_fields} fields, found {fields}'))
+        if len(errors) >= max_errors:
+            break
+
+    return line_count, errors[:max_errors]
+
+
+# === Validate records that span several lines ===
+def validate_records(text, delimiter, quote_char, expected_fields, first_line, max_errors):
+    """
+    Parses a block with the `csv` module, for blocks with quoted fields that contain line breaks.
+
+    Returns:
+        list: `(line number in the block, message)` for each record with an unexpected number of fields.
+    """
+    errors = []
+    reader = csv.reader(io.StringIO(text, newline=''), delimiter=delimiter, quotechar=quote_char, strict=True)
+    try:
+        for row in reader:
+            if len(errors) >= max_errors:
+                break
+            if reader.line_num < first_line or not row:
+                continue
+            if len(row) != expected_fields:
+                errors.append((reader.line_num, f'Expected {expected_fields} fields, found {len(row)}'))
+    except csv.Error as err:
+        errors.append((reader.line_num, f'Malformed quoting: {err}'))
+    return errors
+
+
+# === Validate a byte range of a file ===
+def validate_range(file, start, end, delimiter, quote_char, expected_fields, max_errors):
+    """
+    Reads a line-aligned byte range of an uncompressed file and validates it with `validate_block`.
+    Runs in a worker process, so only the offsets are sent to it.
+    """
+    with open(file, 'rb') as source:
+        source.seek(start)
+        data = source.read(end - start)
+    return validate_block(data, delimiter, quote_char, expected_fields, start == 0, max_errors)
+
+
+# === Read a compressed file in line-aligned blocks ===
+def iter_line_blocks(file, block_size):
+    """
+    Decompresses a file and yields blocks of whole lines of about `block_size` bytes.
+    """
+    carry = b''
+    with file_ops.open_source(file, 'rb') as source:
+        while True:
+            data = source.read(block_size)
+            if not data:
+                break
+            data = carry + data
+            cut = data.rfind(b'\n') + 1
+            if cut == 0:
+                carry = data
+                continue
+            carry = data[cut:]
+            yield data[:cut]
+    if carry:
+        yield carry
+
+
+# === Validate a file ===
+def validate_file(file, validation_settings, use_line_index=False):
+    """
+    Validates a file before it is chunked and uploaded, splitting it into line-aligned ranges checked in parallel by
+    a process pool. Uncompressed files are read by the workers directly. Compressed files are decompressed here and
+    the blocks are sent to the workers.
+
+    Line numbers are made absolute by adding the line counts of the preceding ranges. A record whose quoted field
+    contains a line break at a range boundary is reported as an error.
+
+    Args:
+        file (str): The path of the file.
+        validation_settings (dict): The `validation` block from `settings.json`:
+            - delimiter (str): The field delimiter.
+            - quoteChar (str): The quote character.
+            - expectedHeader (list): The expected column names. Empty skips the header check.
+            - maxErrors (int): Maximum number of errors reported.
+            - processes (int): Number of worker processes. 0 uses one per CPU.
+            - rangeSizeMb (int): Size of the ranges validated by each task.
+        use_line_index (bool): Find the range boundaries in the sidecar line index (see `file_ops.load_line_index`).
+
+    Returns:
+        list: `(line number, message)` for each error found, sorted by line number. Empty if the file is valid.
+    """
+    delimiter = validation_settings["delimiter"]
+    quote_char = validation_settings["quoteChar"]
+    max_errors = validation_settings["maxErrors"]
+    range_size_mb = validation_settings["rangeSizeMb"]
+
+    start_time = time.perf_counter()
+
+    # The header sets the number of fields expected in every record. Only the first line is decoded, an invalid
+    # byte in it is reported with the first range
+    try:
+        with file_ops.open_source(file, 'rb') as source:
+            header_line = source.readline().decode('utf-8', errors='replace')
+    except FileNotFoundError:
+        return [(0, f'File not found: {file}')]
+    header = next(csv.reader([header_line.rstrip('\r\n')], delimiter=delimiter, quotechar=quote_char), [])
+
+    errors = []
+    expected_header = validation_settings["expectedHeader"]
+    if expected_header and header != expected_header:
+        errors.append((1, f'Header {header} does not match the expected header {expected_header}'))
+
+    if file_ops.detect_compression(file) is None:
+        tasks = ((validate_range, file, start, end, delimiter, quote_char, len(header), max_errors)
+                 for start, end in file_ops.compute_chunk_boundaries(file, range_size_mb, use_line_index=use_line_index))
+    else:
+        tasks = ((validate_block, block, delimiter, quote_char, len(header), index == 0, max_errors)
+                 for index, block in enumerate(iter_line_blocks(file, range_size_mb * 1024 * 1024)))
+
+    processes = validation_settings["processes"] or os.cpu_count()
+    lines_before = 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # Collect the ranges in file order, keeping a few per process in flight so decompressed blocks do not pile up
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(*task))
+            while len(pending) > 2 * processes or (pending and pending[0].done()):
+                line_count, range_errors = pending.popleft().result()
+                errors.extend((lines_before + line_number, message) for line_number, message in range_errors)
+                lines_before += line_count
+        while pending:
+            line_count, range_errors = pending.popleft().result()
+            errors.extend((lines_before + line_number, message) for line_number, message in range_errors)
+            lines_before += line_count
+
+    errors = sorted(errors)[:max_errors]
+    elapsed = time.perf_counter() - start_time
+    if errors:
+        logger.error(f'Validation of {file} failed with {len(errors)} errors in {elapsed:.2f}s')
+        print(f'Validation of {file} failed with {len(errors)} errors in {elapsed:.2f}s:')
+        for line_number, message in errors:
+            logger.error(f'Line {line_number}: {message}')
+            print(f'  Line {line_number}: {message}')
+    else:
+        logger.info(f'Validation of {file} passed: {lines_before} lines, {len(header)} fields in {elapsed:.2f}s')
+        print(f'Validation of {file} passed: {lines_before} lines, {len(header)} fields in {elapsed:.2f}s')
+
+    return errors